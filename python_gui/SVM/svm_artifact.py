@@ -0,0 +1,277 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Versioned model artifact shared by svm_train, svm_predict and neo_gui.
+#
+# An artifact is a directory holding model.json (format version, model kind
+# and scalar parameters) and one .npy file per array. Arrays are loaded with
+# np.load(mmap_mode='r'), so loading is immediate and processes that open the
+# same artifact share its pages instead of unpickling private copies.
+#
+# Because other processes may have the arrays mapped, a saved file is never
+# rewritten: every save writes a new version subdirectory v1/, v2/, ... and
+# then atomically replaces the top-level model.json, a copy of that version's
+# metadata plus "current": "vN". Versions older than the previous one are
+# removed where the OS allows it (POSIX keeps unlinked files readable for
+# whoever still maps them; Windows refuses, and they are retried next save).
+# A directory with model.json and the arrays side by side (written before
+# versioning) still loads.
+
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+FORMAT_VERSION = 1
+
+
+def _rbf_kernel(data, centers, gamma):
+    d2 = (np.einsum('ij,ij->i', data, data)[:, None]
+          + np.einsum('ij,ij->i', centers, centers)[None, :]
+          - 2.0 * data @ centers.T)
+    np.maximum(d2, 0, out=d2)
+    return np.exp(-gamma * d2, out=d2)
+
+
+def _linear_predict(features, coef, intercept, classes):
+    scores = features @ coef.T + intercept
+    if scores.shape[1] == 1:
+        return classes[(scores[:, 0] > 0).astype(np.intp)]
+    return classes[np.argmax(scores, axis=1)]
+
+
+class _BatchedClassifier:
+    batch_size = 4096
+
+    @property
+    def classes_(self):
+        return self.classes  # sklearn's name, so code written for sklearn models accepts these too
+
+    def predict(self, data):
+        data = np.asarray(data, dtype=np.float64)
+        out = np.empty(len(data), dtype=self.classes.dtype)
+        for start in range(0, len(data), self.batch_size):
+            out[start:start + self.batch_size] = self._predict(data[start:start + self.batch_size])
+        return out
+
+
+class RBFSVMClassifier(_BatchedClassifier):
+    """One-vs-one RBF SVM evaluated from libsvm's support vectors and dual coefficients."""
+    kind = "svc"
+
+    def __init__(self, support_vectors, dual_coef, intercept, n_support, classes, gamma):
+        self.support_vectors = support_vectors
+        self.dual_coef = dual_coef
+        self.intercept = intercept
+        self.n_support = np.asarray(n_support)
+        self.classes = np.asarray(classes)
+        self.gamma = float(gamma)
+        self.sv_start = np.concatenate(([0], np.cumsum(self.n_support)))
+
+    def arrays(self):
+        return {"support_vectors": self.support_vectors, "dual_coef": self.dual_coef, "intercept": self.intercept,
+                "n_support": self.n_support, "classes": self.classes}
+
+    def params(self):
+        return {"gamma": self.gamma}
+
+    def _predict(self, data):
+        kernel = _rbf_kernel(data, self.support_vectors, self.gamma)
+        n_class = len(self.classes)
+        votes = np.zeros((len(data), n_class), dtype=np.intp)
+        start = self.sv_start
+        p = 0
+        for i in range(n_class):
+            for j in range(i + 1, n_class):
+                si = slice(start[i], start[i + 1])
+                sj = slice(start[j], start[j + 1])
+                dec = (kernel[:, si] @ self.dual_coef[j - 1, si]
+                       + kernel[:, sj] @ self.dual_coef[i, sj]
+                       + self.intercept[p])
+                votes[:, i] += dec > 0
+                votes[:, j] += dec <= 0
+                p += 1
+        return self.classes[np.argmax(votes, axis=1)]
+
+
+class RandomFeatureClassifier(_BatchedClassifier):
+    """Random Fourier features (RBFSampler) followed by a linear SVM."""
+    kind = "rff"
+
+    def __init__(self, weights, offset, coef, intercept, classes):
+        self.weights = weights
+        self.offset = offset
+        self.coef = coef
+        self.intercept = intercept
+        self.classes = np.asarray(classes)
+
+    def arrays(self):
+        return {"weights": self.weights, "offset": self.offset, "coef": self.coef,
+                "intercept": self.intercept, "classes": self.classes}
+
+    def params(self):
+        return {}
+
+    def _predict(self, data):
+        features = np.cos(data @ self.weights + self.offset) * np.sqrt(2.0 / self.weights.shape[1])
+        return _linear_predict(features, self.coef, self.intercept, self.classes)
+
+
+class NystroemClassifier(_BatchedClassifier):
+    """Nystroem RBF features followed by a linear SVM."""
+    kind = "nystroem"
+
+    def __init__(self, components, normalization, coef, intercept, classes, gamma):
+        self.components = components
+        self.normalization = normalization
+        self.coef = coef
+        self.intercept = intercept
+        self.classes = np.asarray(classes)
+        self.gamma = float(gamma)
+
+    def arrays(self):
+        return {"components": self.components, "normalization": self.normalization, "coef": self.coef,
+                "intercept": self.intercept, "classes": self.classes}
+
+    def params(self):
+        return {"gamma": self.gamma}
+
+    def _predict(self, data):
+        features = _rbf_kernel(data, self.components, self.gamma) @ self.normalization.T
+        return _linear_predict(features, self.coef, self.intercept, self.classes)
+
+
+KINDS = {cls.kind: cls for cls in (RBFSVMClassifier, RandomFeatureClassifier, NystroemClassifier)}
+
+
+def from_sklearn(model):
+    """Convert a fitted model from svm_train.MakeModel into flat-array form."""
+    from sklearn import svm
+    from sklearn.kernel_approximation import RBFSampler, Nystroem
+
+    if isinstance(model, svm.SVC):
+        if model.kernel != 'rbf':
+            raise ValueError("Only RBF SVC models can be exported, got kernel=%r" % model.kernel)
+        return RBFSVMClassifier(model.support_vectors_, model._dual_coef_, model._intercept_,
+                                model.n_support_, model.classes_, model._gamma)
+    features, linear = model[0], model[-1]
+    if isinstance(features, RBFSampler):
+        return RandomFeatureClassifier(features.random_weights_, features.random_offset_,
+                                       linear.coef_, linear.intercept_, linear.classes_)
+    if isinstance(features, Nystroem):
+        gamma = features.gamma if features.gamma is not None else 1.0 / features.components_.shape[1]
+        return NystroemClassifier(features.components_, features.normalization_,
+                                  linear.coef_, linear.intercept_, linear.classes_, gamma)
+    raise ValueError("Cannot export model of type %s" % type(model).__name__)
+
+
+def _versions(dirname):
+    return sorted(int(name[1:]) for name in os.listdir(dirname) if name[:1] == "v" and name[1:].isdigit())
+
+
+def _replace_json(path, data, attempts=20):
+    tmp = "%s.%d.tmp" % (path, os.getpid())
+    with open(tmp, "w") as f:
+        json.dump(data, f, indent=1)
+    for attempt in range(attempts):
+        try:
+            os.replace(tmp, path)
+            return
+        except PermissionError:  # Windows: a reader has model.json open for a moment
+            if attempt == attempts - 1:
+                raise
+            time.sleep(0.05)
+
+
+def _publish(dirname, meta, write):
+    """Write a new version of the artifact with write(version_dir) and make it current."""
+    os.makedirs(dirname, exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=".tmp-", dir=dirname)
+    try:
+        os.chmod(tmp, 0o755)
+        write(tmp)
+        with open(os.path.join(tmp, "model.json"), "w") as f:
+            json.dump(meta, f, indent=1)
+        while True:
+            version = "v%d" % (max(_versions(dirname), default=0) + 1)
+            try:
+                os.rename(tmp, os.path.join(dirname, version))
+                break
+            except OSError:
+                if not os.path.exists(os.path.join(dirname, version)):
+                    raise  # Not a concurrent save taking the same number
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    _replace_json(os.path.join(dirname, "model.json"), dict(meta, current=version))
+    # Keep the previous version for readers that saw the old model.json a moment ago
+    for old in _versions(dirname)[:-2]:
+        shutil.rmtree(os.path.join(dirname, "v%d" % old), ignore_errors=True)
+    for name in os.listdir(dirname):
+        if name.endswith(".npy"):  # Unversioned arrays of an old artifact
+            try:
+                os.remove(os.path.join(dirname, name))
+            except OSError:
+                pass
+
+
+def _current(dirname):
+    """(metadata, directory holding the arrays) of the current version."""
+    with open(os.path.join(dirname, "model.json")) as f:
+        meta = json.load(f)
+    if "current" in meta:
+        dirname = os.path.join(dirname, meta["current"])
+        with open(os.path.join(dirname, "model.json")) as f:
+            meta = json.load(f)
+    return meta, dirname
+
+
+def save_artifact(model, dirname, lut=None):
+    """Write model (sklearn or flat-array form) and an optional LookupClassifier to dirname as a new version."""
+    if not hasattr(model, "arrays"):
+        model = from_sklearn(model)
+    meta = {"format_version": FORMAT_VERSION, "kind": model.kind, "params": model.params(),
+            "arrays": sorted(model.arrays()), "lut": lut is not None}
+
+    def write(version_dir):
+        for name, array in model.arrays().items():
+            np.save(os.path.join(version_dir, name + ".npy"), np.ascontiguousarray(array))
+        if lut is not None:
+            _write_lut(lut, version_dir)
+
+    _publish(dirname, meta, write)
+
+
+def _write_lut(lut, version_dir):
+    for name in ("cube", "lo", "hi"):
+        np.save(os.path.join(version_dir, "lut_" + name + ".npy"), getattr(lut, name))
+
+
+def load_artifact(dirname, use_lut=False, mmap_mode='r'):
+    """Load the classifier stored in dirname; use_lut returns its lookup cube instead."""
+    if os.path.basename(dirname) == "model.json":
+        dirname = os.path.dirname(dirname)
+    try:
+        return _load_version(*_current(dirname), use_lut, mmap_mode)
+    except FileNotFoundError:  # The version was pruned between reading model.json and its arrays
+        return _load_version(*_current(dirname), use_lut, mmap_mode)
+
+
+def _load_version(meta, dirname, use_lut, mmap_mode):
+    if meta["format_version"] > FORMAT_VERSION:
+        raise ValueError("Model artifact format %d is newer than supported version %d"
+                         % (meta["format_version"], FORMAT_VERSION))
+
+    def load(name):
+        return np.load(os.path.join(dirname, name + ".npy"), mmap_mode=mmap_mode)
+
+    arrays = {name: load(name) for name in meta["arrays"]}
+    if use_lut:
+        if not meta["lut"]:
+            raise ValueError("Model artifact %s has no lookup cube; run CompileSVM for the current model" % dirname)
+        from svm_lut import LookupClassifier
+        return LookupClassifier(load("lut_cube"), arrays["classes"], load("lut_lo"), load("lut_hi"))
+    return KINDS[meta["kind"]](**arrays, **meta["params"])
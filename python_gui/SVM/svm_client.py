@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Thin client for svm_server.py. svm_model(path) has the same effect as
+# svm_predict.svm_model(path) but only imports the standard library, so a
+# MATLAB call costs one localhost round trip to the already loaded model.
+
+import json
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+DEFAULT_PORT = 8765
+
+
+def _post(url, body, content_type, timeout):
+    request = Request(url, data=body, headers={"Content-Type": content_type})
+    try:
+        with urlopen(request, timeout=timeout) as reply:
+            return reply.read()
+    except HTTPError as exc:
+        # Raise the server's {"error": ...} message instead of a bare status
+        detail = exc.read()
+        try:
+            detail = json.loads(detail)["error"]
+        except (ValueError, KeyError, TypeError):
+            detail = detail.decode(errors="replace") or exc.reason
+        raise RuntimeError("svm_server %s: %s" % (exc.code, detail)) from None
+
+
+def svm_model(path, palette=None, use_lut=False, host="127.0.0.1", port=DEFAULT_PORT, timeout=600):
+    body = json.dumps({"path": path, "palette": palette, "use_lut": bool(use_lut)}).encode()
+    reply = _post("http://%s:%d/svm_model" % (host, port), body, "application/json", timeout)
+    return json.loads(reply)["n"]
+
+
+def predict(path, data, palette=None, use_lut=False, host="127.0.0.1", port=DEFAULT_PORT, timeout=600):
+    # data is any (..., 3) contrast array; returns (labels, colors)
+    import io
+    import numpy as np
+
+    buf = io.BytesIO()
+    np.save(buf, np.asarray(data, dtype=np.float64))
+    query = {"path": path, "use_lut": int(bool(use_lut))}
+    if palette is not None:
+        query["palette"] = json.dumps(np.asarray(palette).tolist())
+    reply = _post("http://%s:%d/predict?%s" % (host, port, urlencode(query)), buf.getvalue(),
+                  "application/octet-stream", timeout)
+    with np.load(io.BytesIO(reply)) as f:
+        return f["labels"], f["colors"]
+
+
+def reload(path=None, host="127.0.0.1", port=DEFAULT_PORT, timeout=60):
+    # Drop the server's cached model for path (or every model); changed model
+    # files are picked up automatically, this forces a fresh load anyway
+    body = json.dumps({} if path is None else {"path": path}).encode()
+    _post("http://%s:%d/reload" % (host, port), body, "application/json", timeout)
+
+
+def ping(host="127.0.0.1", port=DEFAULT_PORT, timeout=1):
+    try:
+        with urlopen("http://%s:%d/ping" % (host, port), timeout=timeout) as reply:
+            return reply.read() == b"ok"
+    except OSError:
+        return False
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Compiled classifier: the SVM decision evaluated once on a dense quantized
+# contrast cube, so that inference is a table lookup per pixel.
+
+import os
+
+import numpy as np
+
+
+class LookupClassifier:
+    """SVM decision baked into a quantized (R, G, B) lookup cube."""
+
+    def __init__(self, cube, classes, lo, hi):
+        self.cube = np.asarray(cube, dtype=np.uint8)
+        self.classes = np.asarray(classes)
+        self.lo = np.asarray(lo, dtype=np.float64)
+        self.hi = np.asarray(hi, dtype=np.float64)
+
+    @property
+    def resolution(self):
+        return self.cube.shape[0]
+
+    def axes(self):
+        """Grid values along each channel, as used by TrainSVM's meshgrid."""
+        return [np.linspace(self.lo[c], self.hi[c], self.cube.shape[c]) for c in range(3)]
+
+    def quantize(self, data):
+        """Nearest grid index per channel; values outside the cube are clipped to its edge."""
+        data = np.asarray(data, dtype=np.float64)
+        n = np.array(self.cube.shape, dtype=np.float64)
+        span = np.where(self.hi > self.lo, self.hi - self.lo, 1.0)
+        idx = np.rint((data - self.lo) / span * (n - 1))
+        np.clip(idx, 0, n - 1, out=idx)
+        return idx.astype(np.intp)
+
+    def predict(self, data):
+        idx = self.quantize(data)
+        return self.classes[self.cube[idx[..., 0], idx[..., 1], idx[..., 2]]]
+
+    def save(self, filename):
+        np.savez(filename, cube=self.cube, classes=self.classes, lo=self.lo, hi=self.hi)
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as f:
+            return cls(f['cube'], f['classes'], f['lo'], f['hi'])
+
+
+def _predict_grid(model, axes, resolution, start, stop):
+    i, j, k = np.unravel_index(np.arange(start, stop), resolution)
+    grid = np.stack((axes[0][i], axes[1][j], axes[2][k]), axis=1)
+    return np.searchsorted(model.classes_, model.predict(grid)).astype(np.uint8)
+
+
+_worker_grid = None
+
+
+def _init_worker(model, axes, resolution):
+    # The model reaches each worker process once through initargs instead of
+    # being pickled again for every batch
+    global _worker_grid
+    _worker_grid = (model, axes, resolution)
+
+
+def _predict_span(bounds):
+    start, stop, batch_size = bounds
+    model, axes, resolution = _worker_grid
+    return np.concatenate([_predict_grid(model, axes, resolution, batch, min(batch + batch_size, stop))
+                           for batch in range(start, stop, batch_size)])
+
+
+def compile_model(model, lo, hi, resolution=64, batch_size=2 ** 18, n_jobs=1):
+    """Evaluate model on a resolution**3 grid spanning [lo, hi] per channel, batch_size points at a time.
+
+    With n_jobs > 1 (or -1 for all cores) the grid is split into n_jobs
+    contiguous spans, one per worker process, each holding its own copy of
+    the model for the whole run.
+    """
+    if np.isscalar(resolution):
+        resolution = (int(resolution),) * 3
+    if len(model.classes_) > 256:
+        raise ValueError("Lookup cube supports at most 256 classes")
+    lo = np.asarray(lo, dtype=np.float64)
+    hi = np.asarray(hi, dtype=np.float64)
+    axes = [np.linspace(lo[c], hi[c], resolution[c]) for c in range(3)]
+    cube = np.empty(resolution, dtype=np.uint8)
+    flat = cube.reshape(-1)
+    if n_jobs is None or n_jobs < 1:
+        n_jobs = os.cpu_count() or 1
+    if n_jobs == 1:
+        for start in range(0, flat.size, batch_size):
+            stop = min(start + batch_size, flat.size)
+            flat[start:stop] = _predict_grid(model, axes, resolution, start, stop)
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        step = -(-flat.size // n_jobs)
+        spans = [(start, min(start + step, flat.size), batch_size) for start in range(0, flat.size, step)]
+        with ProcessPoolExecutor(max_workers=len(spans), initializer=_init_worker,
+                                 initargs=(model, axes, resolution)) as pool:
+            for (start, stop, _), labels in zip(spans, pool.map(_predict_span, spans)):
+                flat[start:stop] = labels
+    return LookupClassifier(cube, model.classes_, lo, hi)
+
+
+def lut_report(model, lut, data, n_random=100000, seed=0):
+    """Agreement of the lookup cube with the exact SVM on data and on uniform samples inside the cube."""
+    data = np.asarray(data, dtype=np.float64)
+    rng = np.random.default_rng(seed)
+    random_data = rng.uniform(lut.lo, lut.hi, size=(n_random, 3))
+    exact_data = model.predict(data)
+    exact_random = model.predict(random_data)
+    return {"Resolution": lut.resolution,
+            "AgreementData": float(np.mean(lut.predict(data) == exact_data)),
+            "AgreementRandom": float(np.mean(lut.predict(random_data) == exact_random)),
+            "NumSupportVectors": int(np.sum(getattr(model, 'n_support_', getattr(model, 'n_support', 0))))}
+
+
+def CompileSVM(path1, resolution=64, margin=0.05):
+    from scipy import io
+    from scipy.io import savemat
+    from svm_artifact import save_artifact
+    from svm_predict import load_model
+
+    # The current model: the svm_model/ artifact, or svm_model.m if a notebook
+    # rewrote it since; the cube is then published together with that model
+    svm_model = load_model(path1)
+    data1 = io.loadmat(path1 + "Contrast2.mat")
+    data1 = data1['AllCon']
+    RGB_data = np.transpose(data1[0:3, :])
+
+    # Cube spans the training range plus a margin on each side
+    lo, hi = RGB_data.min(axis=0), RGB_data.max(axis=0)
+    pad = (hi - lo) * margin
+    lut = compile_model(svm_model, lo - pad, hi + pad, int(resolution))
+    lut.save(path1 + 'svm_lut.npz')
+    save_artifact(svm_model, path1 + 'svm_model', lut=lut)
+
+    report = lut_report(svm_model, lut, RGB_data)
+    savemat(path1 + "LUT_report.mat", report)
+    return report
@@ -4,30 +4,224 @@
 # In[6]:
 
 
-def svm_model(path):
+# Color for each class label, indexed by label value
+PALETTE = [[0, 0, 0],       #Black for Background
+           [0, 255, 0],     #Green for Thin
+           [0, 0, 255],     #Blue for Bulk
+           [255, 255, 0],   #Yellow for Bulk
+           [255, 0, 0]]     #Red for Bulk
+
+
+def colorize(PreResult, palette=None, dtype=None):
+    import numpy as np
+    if palette is None:
+        palette = PALETTE
+    palette = np.asarray(palette, dtype=dtype)
+    labels = np.asarray(PreResult).astype(np.intp)
+    if labels.size and (labels.min() < 0 or labels.max() >= len(palette)):
+        raise ValueError("Label outside palette range 0..%d" % (len(palette) - 1))
+    return palette[labels]
+
+
+def load_model(path, use_lut=False):
+    from svm_trace import span
+    with span("load_model", "svm", path=path, use_lut=bool(use_lut)):
+        return _load_model(path, use_lut)
+
+
+def model_version(path):
+    # Changes whenever TrainSVM, UpdateSVM, CompileSVM or a notebook writes a
+    # new model under path; long-lived callers reload when it does
+    import os
+    version = []
+    for name in ('svm_model/model.json', 'svm_model.m', 'svm_lut.npz'):
+        try:
+            version.append(os.stat(path + name).st_mtime_ns)
+        except FileNotFoundError:
+            version.append(None)
+    return tuple(version)
+
+
+def _artifact_is_current(path):
+    # The svm_model/ artifact is used unless svm_model.m is newer, e.g. after
+    # retraining from a notebook that only dumps the pickle
+    import os
+    artifact, pickle = path + 'svm_model/model.json', path + 'svm_model.m'
+    if not os.path.exists(artifact):
+        return False
+    return not os.path.exists(pickle) or os.path.getmtime(artifact) >= os.path.getmtime(pickle)
+
+
+def _load_model(path, use_lut):
+    # A lookup cube is only used if it was compiled from the current model:
+    # the artifact's own cube, or an svm_lut.npz newer than svm_model.m.
+    # Otherwise raise rather than predict with a cube from an older model.
+    if _artifact_is_current(path):
+        from svm_artifact import load_artifact
+        return load_artifact(path + 'svm_model', use_lut)
+    if use_lut:
+        import os
+        from svm_lut import LookupClassifier
+        lut, pickle = path + 'svm_lut.npz', path + 'svm_model.m'
+        if os.path.exists(pickle) and os.path.exists(lut) and os.path.getmtime(lut) < os.path.getmtime(pickle):
+            raise ValueError("%s is older than %s; run CompileSVM again" % (lut, pickle))
+        return LookupClassifier.load(lut)
     import joblib
+    return joblib.load(path + 'svm_model.m')
+
+
+def svm_model(path, palette=None, use_lut=False):
+    from scipy import io
+    import numpy as np
+    from scipy.io import savemat
+    from svm_trace import span
+    svm_model1 = load_model(path, use_lut)
+    path2 = path + 'im2_con.mat'
+    with span("loadmat im2_con", "svm"):
+        data2 = io.loadmat(path2)
+    data2 = data2['im2_con']
+    data2 = data2[0, :, :]
+    with span("model.predict", "svm", rows=len(data2)):
+        PreResult = svm_model1.predict(data2)
+    with span("colorize", "svm"):
+        DrawResult = colorize(PreResult, palette, dtype=data2.dtype)
+    DrawResult = DrawResult[np.newaxis]
+    with span("savemat DrawResult", "svm"):
+        savemat(path + "DrawResult.mat", {'DrawResult' : DrawResult})
+    return
+
+
+def open_pixels(path):
+    # Returns an (N, 3) array-like that can be sliced by row blocks without
+    # reading the whole matrix: im2_con.npy is memory-mapped, a MAT v7.3
+    # (HDF5) im2_con.mat is read through h5py. A classic MAT file has to be
+    # loaded whole, so only the outputs are streamed in that case.
+    import os
+    import numpy as np
+    if os.path.exists(path + 'im2_con.npy'):
+        data2 = np.load(path + 'im2_con.npy', mmap_mode='r')
+        return data2[0] if data2.ndim == 3 else data2
+    try:
+        import h5py
+        f = h5py.File(path + 'im2_con.mat', 'r')
+    except (ImportError, OSError):
+        from scipy import io
+        return io.loadmat(path + 'im2_con.mat')['im2_con'][0, :, :]
+    return _H5Pixels(f)
+
+
+class _H5Pixels:
+    # MATLAB stores arrays column-major, so a 1xNx3 im2_con appears in HDF5 as 3xNx1.
+    # Owns the h5py file; use as a context manager or call close().
+    def __init__(self, f):
+        self.file = f
+        try:
+            self.dataset = f['im2_con']
+        except KeyError:
+            f.close()
+            raise
+        self.shape = (self.dataset.shape[1], self.dataset.shape[0])
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, rows):
+        return self.dataset[:, rows, 0].T
+
+
+def _label_dtype(model):
+    # Smallest integer dtype that holds every class label of the model (sklearn
+    # classes_, artifact or lookup classes), so PreResult cannot wrap. Labels
+    # read from Contrast2.mat are MATLAB doubles; whole-number floats are fine.
+    import numpy as np
+    classes = np.asarray(model.classes_ if hasattr(model, 'classes_') else model.classes)
+    if classes.dtype.kind == 'f' and np.all(np.isfinite(classes)) and np.all(classes == np.round(classes)):
+        classes = classes.astype(np.int64)
+    if classes.dtype.kind not in 'biu':
+        raise ValueError("PreResult needs whole-number class labels, model has %s" % classes.dtype)
+    return np.result_type(np.min_scalar_type(classes.min()), np.min_scalar_type(classes.max()))
+
+
+def svm_model_stream(path, block_rows=262144, palette=None, use_lut=False):
+    import numpy as np
+    from contextlib import nullcontext
+    from numpy.lib.format import open_memmap
+    from svm_trace import span
+    svm_model1 = load_model(path, use_lut)
+    label_dtype = _label_dtype(svm_model1)
+    data2 = open_pixels(path)
+    with data2 if isinstance(data2, _H5Pixels) else nullcontext():
+        n = len(data2)
+        PreResult = open_memmap(path + 'PreResult.npy', mode='w+', dtype=label_dtype, shape=(n,))
+        DrawResult = open_memmap(path + 'DrawResult.npy', mode='w+', dtype=np.uint8, shape=(n, 3))
+        for start in range(0, n, block_rows):
+            stop = min(start + block_rows, n)
+            with span("read block", "svm", rows=stop - start):
+                block = np.asarray(data2[start:stop])
+            with span("model.predict", "svm", rows=stop - start):
+                labels = svm_model1.predict(block).astype(label_dtype)
+            PreResult[start:stop] = labels
+            DrawResult[start:stop] = colorize(labels, palette, dtype=np.uint8)
+        PreResult.flush()
+        DrawResult.flush()
+        del PreResult, DrawResult
+    return n
+
+
+_worker_model = None
+
+
+def _init_worker(path, use_lut):
+    # Loaded once per worker process. The svm_model/ artifact is memory-mapped,
+    # and so are the arrays of an uncompressed svm_model.m through joblib, so
+    # the support vectors are shared through the page cache instead of being
+    # unpickled into every worker.
+    global _worker_model
+    if use_lut or _artifact_is_current(path):
+        _worker_model = load_model(path, use_lut)
+    else:
+        import joblib
+        _worker_model = joblib.load(path + 'svm_model.m', mmap_mode='r')
+
+
+def _predict_chunk(chunk):
+    return _worker_model.predict(chunk)
+
+
+def predict_parallel(path, data2, n_jobs=None, chunk_rows=65536, use_lut=False):
+    import os
+    import numpy as np
+    from concurrent.futures import ProcessPoolExecutor
+    from svm_trace import span
+    if n_jobs is None:
+        n_jobs = os.cpu_count() or 1
+    chunks = [data2[start:start + chunk_rows] for start in range(0, len(data2), chunk_rows)]
+    with span("predict_parallel", "svm", rows=len(data2), n_jobs=int(n_jobs)), \
+            ProcessPoolExecutor(max_workers=int(n_jobs), initializer=_init_worker, initargs=(path, use_lut)) as pool:
+        results = list(pool.map(_predict_chunk, chunks))
+    return np.concatenate(results) if results else np.empty(0)
+
+
+def svm_model_parallel(path, n_jobs=None, chunk_rows=65536, palette=None, use_lut=False):
     from scipy import io
     import numpy as np
     from scipy.io import savemat
-    svm_model1 = joblib.load(path + 'svm_model.m')
     path2 = path + 'im2_con.mat'
     data2 = io.loadmat(path2)
     data2 = data2['im2_con']
     data2 = data2[0, :, :]
-    PreResult = svm_model1.predict(data2)
-    DrawResult = data2
-    for i in range(len(DrawResult)):
-        if PreResult[i] == 0:
-            DrawResult[i, :] = [0, 0, 0] #Black for Background
-        elif PreResult[i] == 1:
-            DrawResult[i, :] = [0, 255, 0] #Green for Thin
-        elif PreResult[i] == 2:
-            DrawResult[i, :] = [0, 0, 255] #Blue for Bulk
-        elif PreResult[i] == 3:
-            DrawResult[i, :] = [255, 255, 0] #Yellow for Bulk
-        elif PreResult[i] == 4:
-            DrawResult[i, :] = [255, 0, 0] #Red for Bulk     
-    DrawResult = np.array([DrawResult])
+    PreResult = predict_parallel(path, data2, n_jobs, int(chunk_rows), use_lut)
+    DrawResult = colorize(PreResult, palette, dtype=data2.dtype)
+    DrawResult = DrawResult[np.newaxis]
     savemat(path + "DrawResult.mat", {'DrawResult' : DrawResult})
     return
 
@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Long-lived local prediction service. Models stay loaded between calls and
+# concurrent requests for the same model are batched into one predict call.
+#
+#   python svm_server.py --port 8765
+#
+# Endpoints (localhost only by default):
+#   GET  /ping                           -> "ok"
+#   POST /predict?path=...&use_lut=0     body: .npy array (..., 3) of contrast
+#                                        reply: .npz with labels (...) and colors (..., 3)
+#   POST /svm_model                      body: JSON {"path": ..., "use_lut": ..., "palette": ...}
+#                                        runs svm_model(path) server side, writes DrawResult.mat
+#   POST /reload                         body: JSON {"path": ...} or {} to drop every cached model
+#
+# Models are reloaded when their files change (svm_predict.model_version).
+# Loading a model unpickles it, so the server only accepts paths inside the
+# --root directories (default: the working directory), only requests whose
+# Host and Origin are localhost, and only the JSON / .npy content types,
+# which a web page cannot send cross-site without a CORS preflight that
+# this server never grants. Failures reply {"error": ...} with status 4xx/5xx.
+# svm_client.py holds the matching client functions.
+
+import argparse
+import io
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+from scipy import io as sio
+
+from svm_predict import load_model, model_version, colorize
+
+DEFAULT_PORT = 8765
+LOCAL_HOSTS = ("127.0.0.1", "localhost", "[::1]")
+
+
+class ModelServer:
+    """Keeps models loaded and batches concurrent predictions per model."""
+
+    def __init__(self, batch_window=0.002, max_batch_rows=2 ** 22, roots=None):
+        self.batch_window = batch_window
+        self.max_batch_rows = max_batch_rows
+        self.roots = [os.path.realpath(root) for root in (roots or [os.getcwd()])]
+        self.models = {}  # (path, use_lut) -> (model_version, model)
+        self.models_lock = threading.Lock()
+        self.requests = queue.Queue()
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def check_path(self, path):
+        # path is a directory prefix as in svm_predict ('.../run1/'); only
+        # models under the configured roots are ever loaded
+        real = os.path.realpath(os.path.dirname(path + 'x'))
+        if not any(os.path.commonpath([real, root]) == root for root in self.roots):
+            raise PermissionError("Model path %r is outside the served roots" % path)
+
+    def model(self, path, use_lut=False):
+        key = (path, bool(use_lut))
+        version = model_version(path)
+        with self.models_lock:
+            cached = self.models.get(key)
+            if cached is None or cached[0] != version:
+                self.models[key] = cached = (version, load_model(path, use_lut))
+            return cached[1]
+
+    def reload(self, path=None):
+        with self.models_lock:
+            for key in list(self.models):
+                if path is None or key[0] == path:
+                    del self.models[key]
+
+    def predict(self, path, data, use_lut=False):
+        self.check_path(path)
+        data = np.asarray(data, dtype=np.float64)
+        future = Future()
+        self.requests.put(((path, bool(use_lut)), data.reshape(-1, data.shape[-1]), future))
+        return future.result().reshape(data.shape[:-1])
+
+    def _run(self):
+        while True:
+            pending = [self.requests.get()]
+            rows = len(pending[0][1])
+            deadline = time.perf_counter() + self.batch_window
+            while rows < self.max_batch_rows:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self.requests.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                pending.append(item)
+                rows += len(item[1])
+            groups = {}
+            for item in pending:
+                groups.setdefault(item[0], []).append(item)
+            for key, items in groups.items():
+                self._predict_group(key, items)
+
+    def _predict_group(self, key, items):
+        try:
+            model = self.model(*key)
+            labels = model.predict(np.concatenate([data for _, data, _ in items]))
+        except Exception as exc:
+            for _, _, future in items:
+                future.set_exception(exc)
+            return
+        start = 0
+        for _, data, future in items:
+            future.set_result(labels[start:start + len(data)])
+            start += len(data)
+
+    def svm_model(self, path, palette=None, use_lut=False):
+        self.check_path(path)
+        data2 = sio.loadmat(path + 'im2_con.mat')['im2_con'][0, :, :]
+        PreResult = self.predict(path, data2, use_lut)
+        DrawResult = colorize(PreResult, palette, dtype=data2.dtype)[np.newaxis]
+        sio.savemat(path + "DrawResult.mat", {'DrawResult' : DrawResult})
+        return len(PreResult)
+
+
+def make_handler(server_state, port=DEFAULT_PORT):
+    local = {"%s:%d" % (host, port) for host in LOCAL_HOSTS} | set(LOCAL_HOSTS)
+
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, body, content_type, status=200):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _body(self):
+            return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        def _forbidden(self, content_type):
+            # Host guards against DNS rebinding, Origin and the content type
+            # against cross-site requests from a browser
+            if self.headers.get("Host", "") not in local:
+                return "Host %r is not localhost" % self.headers.get("Host")
+            origin = self.headers.get("Origin")
+            if origin is not None and urlparse(origin).netloc not in local:
+                return "Origin %r is not localhost" % origin
+            if self.headers.get("Content-Type", "").split(";")[0].strip() != content_type:
+                return "Content-Type must be %s" % content_type
+            return None
+
+        def do_GET(self):
+            if urlparse(self.path).path == "/ping":
+                self._reply(b"ok", "text/plain")
+            else:
+                self._reply(b"not found", "text/plain", 404)
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            content_type = "application/octet-stream" if url.path == "/predict" else "application/json"
+            reason = self._forbidden(content_type)
+            if reason is not None:
+                self._reply(json.dumps({"error": reason}).encode(), "application/json", 403)
+                return
+            try:
+                if url.path == "/predict":
+                    data = np.load(io.BytesIO(self._body()), allow_pickle=False)
+                    use_lut = query.get("use_lut", ["0"])[0] not in ("0", "false", "")
+                    labels = server_state.predict(query["path"][0], data, use_lut)
+                    palette = json.loads(query["palette"][0]) if "palette" in query else None
+                    out = io.BytesIO()
+                    np.savez(out, labels=labels, colors=colorize(labels, palette, dtype=np.uint8))
+                    self._reply(out.getvalue(), "application/octet-stream")
+                elif url.path == "/svm_model":
+                    args = json.loads(self._body())
+                    n = server_state.svm_model(args["path"], args.get("palette"), args.get("use_lut", False))
+                    self._reply(json.dumps({"n": n}).encode(), "application/json")
+                elif url.path == "/reload":
+                    server_state.reload(json.loads(self._body() or b"{}").get("path"))
+                    self._reply(b"{}", "application/json")
+                else:
+                    self._reply(b"not found", "text/plain", 404)
+            except PermissionError as exc:
+                self._reply(json.dumps({"error": str(exc)}).encode(), "application/json", 403)
+            except Exception as exc:
+                self._reply(json.dumps({"error": repr(exc)}).encode(), "application/json", 500)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(host="127.0.0.1", port=DEFAULT_PORT, batch_window=0.002, roots=None):
+    httpd = ThreadingHTTPServer((host, port), make_handler(ModelServer(batch_window, roots=roots), port))
+    httpd.daemon_threads = True
+    try:
+        httpd.serve_forever()
+    finally:
+        httpd.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve SVM thickness predictions over localhost HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--batch-window", type=float, default=0.002,
+                        help="seconds to wait for concurrent requests to batch together")
+    parser.add_argument("--root", action="append", dest="roots",
+                        help="directory whose models may be served (repeatable; default: working directory)")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.batch_window, args.roots)
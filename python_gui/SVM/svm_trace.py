@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# coding: utf-8
+
+# Opt-in timing spans for the SVM scripts and the GUIs.
+#
+#   with span("model.predict", rows=len(data)):
+#       labels = model.predict(data)
+#
+# Disabled by default: span() then returns one shared no-op context manager,
+# so an instrumented call costs a function call and an attribute check.
+# Enable with the SVM_TRACE environment variable (the trace is written to that
+# path at exit) or with enable() / dump() from Python or MATLAB. Traces are
+# Chrome trace-event JSON, readable by chrome://tracing, Perfetto and speedscope
+# as a timeline / flame graph; summary() gives per-span totals for live display.
+
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+_NULL_SPAN = nullcontext()
+
+
+class _Span:
+    __slots__ = ("tracer", "name", "cat", "args", "start")
+
+    def __init__(self, tracer, name, cat, args):
+        self.tracer = tracer
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.record(self.name, self.cat, self.start, time.perf_counter_ns() - self.start, self.args)
+        return False
+
+
+class Tracer:
+    """Collects named spans as trace events plus running per-name statistics."""
+
+    def __init__(self, max_events=1000000):
+        self.enabled = False
+        self.path = None
+        self.max_events = max_events
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter_ns()
+        self.events = []
+        self.dropped = 0
+        self.stats = {}  # name -> [count, total_ns, max_ns, last_ns]
+
+    def enable(self, path=None):
+        """Start recording; with a path the trace is also written there at exit."""
+        self.enabled = True
+        if path:
+            if self.path is None:
+                atexit.register(self._dump_at_exit)
+            self.path = path
+
+    def disable(self):
+        self.enabled = False
+
+    def clear(self):
+        with self.lock:
+            self.events = []
+            self.dropped = 0
+            self.stats = {}
+
+    def span(self, name, cat="", **args):
+        """Context manager timing the enclosed block under name; a no-op while disabled."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, cat, args)
+
+    def record(self, name, cat, start_ns, duration_ns, args=None):
+        event = {"name": name, "cat": cat, "ph": "X", "ts": (start_ns - self.origin) / 1000,
+                 "dur": duration_ns / 1000, "pid": os.getpid(), "tid": threading.get_ident()}
+        if args:
+            event["args"] = args
+        with self.lock:
+            if len(self.events) < self.max_events:
+                self.events.append(event)
+            else:
+                self.dropped += 1
+            stat = self.stats.get(name)
+            if stat is None:
+                self.stats[name] = [1, duration_ns, duration_ns, duration_ns]
+            else:
+                stat[0] += 1
+                stat[1] += duration_ns
+                stat[2] = max(stat[2], duration_ns)
+                stat[3] = duration_ns
+
+    def summary(self):
+        """[(name, count, total_ms, mean_ms, max_ms, last_ms)] sorted by total time."""
+        with self.lock:
+            rows = [(name, count, total / 1e6, total / count / 1e6, longest / 1e6, last / 1e6)
+                    for name, (count, total, longest, last) in self.stats.items()]
+        return sorted(rows, key=lambda row: -row[2])
+
+    def dump(self, path=None):
+        """Write the recorded spans as Chrome trace-event JSON; returns the path."""
+        path = path or self.path or "svm_trace.json"
+        with self.lock:
+            trace = {"traceEvents": list(self.events), "displayTimeUnit": "ms",
+                     "otherData": {"dropped_events": self.dropped}}
+        with open(path, "w") as f:
+            json.dump(trace, f)
+        return path
+
+    def _dump_at_exit(self):
+        if self.path and (self.events or self.dropped):
+            self.dump(self.path)
+
+
+tracer = Tracer()
+span = tracer.span
+enable = tracer.enable
+disable = tracer.disable
+dump = tracer.dump
+summary = tracer.summary
+
+if os.environ.get("SVM_TRACE"):
+    enable(os.environ["SVM_TRACE"])
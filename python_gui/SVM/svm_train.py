@@ -4,47 +4,244 @@
 # In[ ]:
 
 
-def TrainSVM(path1, C_par, gamma_par, TrainSize_par, TestSize_par):
+def LoadContrast(path1):
     import numpy as np
-    from sklearn import svm
-    import matplotlib.pyplot as plt
-    from sklearn.model_selection import train_test_split
-    import matplotlib as mpl
     from scipy import io
-    from scipy.io import savemat
-    import joblib
-    
-    data1 = io.loadmat(path1 + "Contrast2.mat")
+    from svm_trace import span
+
+    with span("loadmat Contrast2", "svm"):
+        data1 = io.loadmat(path1 + "Contrast2.mat")
     data1 = data1['AllCon']
     RGB_data = data1[0:3, :]
     label_data = data1[4, :]
-    
+
     RGB_data = np.transpose(RGB_data)
+    return RGB_data, label_data
+
+
+def SaveSVMResults(path1, svm_model, RGB_data, label_data, Grid_res=50, n_jobs=1):
+    # The decision boundary is evaluated in batches (optionally on n_jobs
+    # cores) and stored as the axis vectors R_, G_, B_ plus a uint8 label
+    # cube grid_hat[i, j, k] for (R_[i], G_[j], B_[k]); rebuild the
+    # coordinate cubes in MATLAB with ndgrid(R_, G_, B_) if needed.
+    import numpy as np
+    from scipy.io import savemat
+    from svm_lut import compile_model
+    from svm_trace import span
+
+    with span("decision grid", "svm", resolution=int(Grid_res)):
+        lut = compile_model(svm_model, RGB_data.min(axis=0), RGB_data.max(axis=0), int(Grid_res), n_jobs=int(n_jobs))
+    R_, G_, B_ = lut.axes()
+    if np.all(lut.classes == np.round(lut.classes)) and lut.classes.min() >= 0 and lut.classes.max() < 256:
+        grid_hat = lut.classes.astype(np.uint8)[lut.cube]
+    else:
+        grid_hat = lut.cube  # Class indices into "classes"
+
+    mdic1 = {"R_": R_, "G_" : G_, "B_" : B_, "grid_hat" : grid_hat, "classes" : lut.classes, "RGB_data" : RGB_data, "label_data" : label_data}
+    with span("savemat SVM_results", "svm"):
+        savemat(path1 + "SVM_results.mat", mdic1)
+    SaveModel(path1, svm_model)
+
+
+def SaveModel(path1, svm_model):
+    # svm_model.m for existing callers, plus the memory-mappable artifact
+    # directory svm_model/ read by svm_predict and neo_gui. Both are written
+    # beside the old files and swapped in, since running predictors may have
+    # the old ones memory-mapped; the artifact is written last so it is the
+    # newer of the two (svm_predict.load_model picks the newer one).
+    import os
+    import joblib
+    from svm_artifact import save_artifact
+    from svm_trace import span
+
+    with span("save model", "svm"):
+        tmp = path1 + 'svm_model.m.%d.tmp' % os.getpid()
+        joblib.dump(svm_model, tmp)
+        os.replace(tmp, path1 + 'svm_model.m')
+        save_artifact(svm_model, path1 + 'svm_model')
+
+
+def MakeModel(C_par, gamma_par, backend='svc', n_components=500):
+    # 'svc' is the exact RBF SVM. 'rff' (random Fourier features) and
+    # 'nystroem' approximate the same RBF kernel with n_components explicit
+    # features followed by a linear SVM, so training is linear in the number
+    # of samples and prediction no longer depends on the support vectors.
+    from sklearn import svm
+    from sklearn.kernel_approximation import RBFSampler, Nystroem
+    from sklearn.pipeline import make_pipeline
+
+    if backend == 'svc':
+        return svm.SVC(C=C_par, kernel='rbf', gamma=gamma_par, decision_function_shape='ovr')
+    if backend == 'rff':
+        features = RBFSampler(gamma=gamma_par, n_components=int(n_components), random_state=1)
+    elif backend == 'nystroem':
+        features = Nystroem(kernel='rbf', gamma=gamma_par, n_components=int(n_components), random_state=1)
+    else:
+        raise ValueError("Unknown backend %r, expected 'svc', 'rff' or 'nystroem'" % backend)
+    return make_pipeline(features, svm.LinearSVC(C=C_par))
+
+
+def TrainSVM(path1, C_par, gamma_par, TrainSize_par, TestSize_par, LUT_res=None, backend='svc', n_components=500, Grid_res=50, n_jobs=1):
+    from sklearn.model_selection import train_test_split
+    from scipy.io import savemat
+    from svm_trace import span
+
+    RGB_data, label_data = LoadContrast(path1)
     train_data, test_data, train_label, test_label = train_test_split(RGB_data, label_data, random_state=1, train_size = TrainSize_par, test_size = TestSize_par)
-    
+
+    svm_model = MakeModel(C_par, gamma_par, backend, n_components)
+    with span("model.fit", "svm", rows=len(train_data), backend=backend):
+        svm_model.fit(train_data, train_label)
+
+    with span("score", "svm"):
+        ScoreDic = {"TrainScore": svm_model.score(train_data, train_label), "TestScore": svm_model.score(test_data, test_label)}
+    savemat(path1+"Score.mat", ScoreDic)
+
+    SaveSVMResults(path1, svm_model, RGB_data, label_data, Grid_res, n_jobs)
+
+    if LUT_res:
+        from svm_lut import CompileSVM
+        CompileSVM(path1, LUT_res)
+
+
+def SearchSVM(path1, C_list, gamma_list, TrainSize_par, TestSize_par, cv=5, n_jobs=-1, LUT_res=None, Grid_res=50):
+    # Cross-validated grid search over every (C, gamma) pair, spread over
+    # n_jobs cores (-1 for all). Contrast2.mat is read once; the best pair is
+    # refit on the training split and saved like TrainSVM does.
+    import numpy as np
+    from sklearn import svm
+    from sklearn.model_selection import train_test_split, GridSearchCV
+    from scipy.io import savemat
+    from svm_trace import span
+
+    C_list = np.atleast_1d(np.asarray(C_list, dtype=float)).ravel()
+    gamma_list = np.atleast_1d(np.asarray(gamma_list, dtype=float)).ravel()
+
+    RGB_data, label_data = LoadContrast(path1)
+    train_data, test_data, train_label, test_label = train_test_split(RGB_data, label_data, random_state=1, train_size = TrainSize_par, test_size = TestSize_par)
+
+    search = GridSearchCV(svm.SVC(kernel='rbf', decision_function_shape='ovr'),
+                          {"C": C_list, "gamma": gamma_list}, cv=int(cv), n_jobs=int(n_jobs), refit=True)
+    with span("grid search", "svm", rows=len(train_data), candidates=len(C_list) * len(gamma_list)):
+        search.fit(train_data, train_label)
+    svm_model = search.best_estimator_
+
+    # cv_results_ iterates gamma fastest for the sorted param names (C, gamma)
+    shape = (len(C_list), len(gamma_list))
+    ScoreDic = {"TrainScore": svm_model.score(train_data, train_label), "TestScore": svm_model.score(test_data, test_label),
+                "C_list": C_list, "gamma_list": gamma_list,
+                "CVScore": search.cv_results_["mean_test_score"].reshape(shape),
+                "CVStd": search.cv_results_["std_test_score"].reshape(shape),
+                "BestC": search.best_params_["C"], "BestGamma": search.best_params_["gamma"]}
+    savemat(path1+"Score.mat", ScoreDic)
+
+    SaveSVMResults(path1, svm_model, RGB_data, label_data, Grid_res, n_jobs)
+
+    if LUT_res:
+        from svm_lut import CompileSVM
+        CompileSVM(path1, LUT_res)
+    return {"C": float(search.best_params_["C"]), "gamma": float(search.best_params_["gamma"])}
+
+
+def CompareBackends(path1, C_par, gamma_par, TrainSize_par, TestSize_par, n_components=500, n_predict=200000):
+    # Training time, prediction throughput and accuracy of each backend on
+    # the same split, saved to BackendComparison.mat. No model is written.
+    import time
+    import numpy as np
+    from sklearn.model_selection import train_test_split
+    from scipy.io import savemat
+
+    RGB_data, label_data = LoadContrast(path1)
+    train_data, test_data, train_label, test_label = train_test_split(RGB_data, label_data, random_state=1, train_size = TrainSize_par, test_size = TestSize_par)
+    rng = np.random.default_rng(0)
+    predict_data = rng.uniform(RGB_data.min(axis=0), RGB_data.max(axis=0), size=(int(n_predict), 3))
+
+    backends = ['svc', 'rff', 'nystroem']
+    TrainTime, PredictRate, TrainScore, TestScore = [], [], [], []
+    for backend in backends:
+        svm_model = MakeModel(C_par, gamma_par, backend, n_components)
+        t0 = time.perf_counter()
+        svm_model.fit(train_data, train_label)
+        TrainTime.append(time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        svm_model.predict(predict_data)
+        PredictRate.append(len(predict_data) / (time.perf_counter() - t0))
+        TrainScore.append(svm_model.score(train_data, train_label))
+        TestScore.append(svm_model.score(test_data, test_label))
+
+    CompareDic = {"Backend": np.array(backends, dtype=object), "TrainTime": np.array(TrainTime),
+                  "PredictRate": np.array(PredictRate), "TrainScore": np.array(TrainScore),
+                  "TestScore": np.array(TestScore), "n_components": n_components}
+    savemat(path1 + "BackendComparison.mat", CompareDic)
+    return CompareDic
+
+
+def UpdateSVM(path1, C_par, gamma_par, TestSize_par=0.2, Grid_res=0):
+    # Incremental training: svm_store.npz keeps how many AllCon columns have
+    # been ingested, the support vectors of the current model and the
+    # accumulated test samples. Only the columns appended to Contrast2.mat
+    # since the last call are used; they are split into train/test and the
+    # SVM is refit on the previous support vectors plus the new training
+    # samples, so the cost follows the model size rather than the history.
+    # TrainScore is measured on the new training samples only, a random slice
+    # like TrainSVM's, since the kept support vectors are the hardest points.
+    # A shrunken Contrast2.mat or a different C/gamma raises; delete
+    # svm_store.npz to start over from the whole history.
+    import os
+    import numpy as np
+    from sklearn import svm
+    from sklearn.model_selection import train_test_split
+    from scipy.io import savemat
+    from svm_trace import span
+
+    store_path = path1 + "svm_store.npz"
+    RGB_data, label_data = LoadContrast(path1)
+    if os.path.exists(store_path):
+        with np.load(store_path) as store:
+            n_ingested = int(store["n_ingested"])
+            sv_data, sv_label = store["sv_data"], store["sv_label"]
+            test_data, test_label = store["test_data"], store["test_label"]
+            stored = (float(store["C"]), float(store["gamma"])) if "C" in store.files else None
+        if len(RGB_data) < n_ingested:
+            raise ValueError("Contrast2.mat has %d samples but %d were already ingested; delete %s to retrain"
+                             % (len(RGB_data), n_ingested, store_path))
+        if stored is not None and stored != (float(C_par), float(gamma_par)):
+            raise ValueError("svm_store.npz was trained with C=%g, gamma=%g, not C=%g, gamma=%g; delete %s to retrain"
+                             % (stored + (C_par, gamma_par, store_path)))
+    else:
+        n_ingested = 0
+        sv_data, sv_label = np.empty((0, 3)), np.empty(0)
+        test_data, test_label = np.empty((0, 3)), np.empty(0)
+
+    new_data, new_label = RGB_data[n_ingested:], label_data[n_ingested:]
+    if len(new_data) == 0:
+        return {"NewSamples": 0}
+    if TestSize_par and len(new_data) > 1:
+        new_train, new_test, new_train_label, new_test_label = train_test_split(new_data, new_label, random_state=1, test_size = TestSize_par)
+    else:
+        new_train, new_train_label = new_data, new_label
+        new_test, new_test_label = np.empty((0, 3)), np.empty(0)
+
+    train_data = np.concatenate((sv_data, new_train))
+    train_label = np.concatenate((sv_label, new_train_label))
+    test_data = np.concatenate((test_data, new_test))
+    test_label = np.concatenate((test_label, new_test_label))
+
     svm_model = svm.SVC(C=C_par, kernel='rbf', gamma=gamma_par, decision_function_shape='ovr')
-    svm_model.fit(train_data, train_label)
-    
-    ScoreDic = {"TrainScore": svm_model.score(train_data, train_label), "TestScore": svm_model.score(test_data, test_label)}
+    with span("model.fit", "svm", rows=len(train_data)):
+        svm_model.fit(train_data, train_label)
+
+    ScoreDic = {"TrainScore": svm_model.score(new_train, new_train_label),
+                "TestScore": svm_model.score(test_data, test_label) if len(test_data) else np.nan,
+                "NewSamples": len(new_data), "TotalSamples": len(RGB_data),
+                "NumSupportVectors": len(svm_model.support_)}
     savemat(path1+"Score.mat", ScoreDic)
-    
-    R_min, R_max = RGB_data[:,0].min(), RGB_data[:,0].max()
-    G_min, G_max = RGB_data[:,1].min(), RGB_data[:,1].max()
-    B_min, B_max = RGB_data[:,2].min(), RGB_data[:,2].max()
-    R_ = np.linspace(R_min, R_max, 50)
-    G_ = np.linspace(G_min, G_max, 50)
-    B_ = np.linspace(B_min, B_max, 50)
-    Rs, Gs, Bs = np.meshgrid(R_, G_, B_, indexing='ij')
-    assert np.all(Rs[:,0,0] == R_)
-    assert np.all(Gs[0,:,0] == G_)
-    assert np.all(Bs[0,0,:] == B_)
-    
-    grid_test = np.stack((Rs.flat, Gs.flat, Bs.flat), axis=1)
-    grid_hat = svm_model.predict(grid_test)
-    grid_hat = grid_hat.reshape(Rs.shape)
-    
-    
-    mdic1 = {"Rs": Rs, "Gs" : Gs, "Bs" : Bs, "grid_hat" : grid_hat, "RGB_data" : RGB_data, "label_data" : label_data}
-    savemat(path1 + "SVM_results.mat", mdic1)
-    joblib.dump(svm_model, path1 + 'svm_model.m')
 
+    np.savez(store_path, n_ingested=len(RGB_data),
+             sv_data=train_data[svm_model.support_], sv_label=train_label[svm_model.support_],
+             test_data=test_data, test_label=test_label, C=C_par, gamma=gamma_par)
+    if Grid_res:
+        SaveSVMResults(path1, svm_model, RGB_data, label_data, Grid_res)
+    else:
+        SaveModel(path1, svm_model)
+    return ScoreDic
@@ -0,0 +1,259 @@
+from startup import lazy_import
+
+np = lazy_import("numpy")
+
+LINE, PREDICTION, BOX = 0, 1, 2
+
+
+class AnnotationStore:
+    """Measurement lines, reference boxes and prediction labels in image coordinates, drawn only where visible.
+
+    Geometry is kept in NumPy arrays, one row (x0, y0, x1, y1) per item: the
+    ends of a line, two opposite corners of a box, or for a prediction a
+    point stored as a zero-length segment. A uniform grid of
+    cell x cell image pixels maps to the items whose bounding boxes touch
+    each cell, so viewport queries and hit tests only look at the items in
+    the few cells they cover and then filter those with array operations.
+    Only items inside the view have canvas items: render() creates, moves
+    and deletes them as the view changes, so zooming with hundreds of
+    annotations costs canvas calls for the visible ones only. Removed items
+    keep their index (alive is False) so indices held by callers stay valid
+    until clear().
+    """
+
+    def __init__(self, canvas, cell=256, margin=64, tag="annotation"):
+        self.canvas = canvas
+        self.cell = cell
+        self.margin = margin  # Canvas pixels around the view that still get drawn, so labels do not pop in at the edge
+        self.tag = tag
+        self.clear()
+
+    def clear(self):
+        """Forget every item and delete everything drawn."""
+        for index in list(getattr(self, "drawn", ())):
+            self._undraw(index)
+        self.coords = np.empty((0, 4))
+        self.kind = np.empty(0, dtype=np.int8)
+        self.alive = np.empty(0, dtype=bool)
+        self.count = 0
+        self.text = []  # Label text per item
+        self.fill = []  # Colour per item
+        self.number = []  # 1-based line or box number, stable when earlier ones are removed
+        self.lines_added = 0
+        self.boxes_added = 0
+        self.grid = {}  # (column, row) -> set of item indices
+        self.drawn = {}  # index -> canvas item ids
+        self.selected = None
+        self.view = (1.0, (0.0, 0.0))  # (scale, offset) the canvas items are placed for
+
+    def __len__(self):
+        return int(self.alive[:self.count].sum())
+
+    def _append(self, kind, row, text, fill):
+        if self.count == len(self.coords):  # Grow by doubling so appends stay amortized O(1)
+            capacity = max(16, 2 * self.count)
+            self.coords = np.resize(self.coords, (capacity, 4))
+            self.kind = np.resize(self.kind, capacity)
+            self.alive = np.resize(self.alive, capacity)
+        index = self.count
+        self.count += 1
+        self.coords[index] = row
+        self.kind[index] = kind
+        self.alive[index] = True
+        self.text.append(text)
+        self.fill.append(fill)
+        self._index(index)
+        return index
+
+    def add_line(self, start, end, fill, text=""):
+        """Store a line from start to end (image pixels) and return its index."""
+        self.lines_added += 1
+        self.number.append(self.lines_added)
+        return self._append(LINE, (start[0], start[1], end[0], end[1]), text, fill)
+
+    def add_box(self, box, fill, text=""):
+        """Store a box (x0, y0, x1, y1) in image pixels and return its index."""
+        self.boxes_added += 1
+        self.number.append(self.boxes_added)
+        return self._append(BOX, box, text, fill)
+
+    def add_prediction(self, center, text, fill="blue"):
+        """Store a text label at center (image pixels) and return its index."""
+        self.number.append(None)
+        return self._append(PREDICTION, (center[0], center[1], center[0], center[1]), text, fill)
+
+    def line(self, index):
+        """((x0, y0), (x1, y1)) of a line in image pixels."""
+        x0, y0, x1, y1 = self.coords[index]
+        return (x0, y0), (x1, y1)
+
+    def lines(self):
+        """Indices of the lines still present, in the order they were drawn."""
+        return self.of_kind(LINE)
+
+    def boxes(self):
+        """Indices of the boxes still present, in the order they were drawn."""
+        return self.of_kind(BOX)
+
+    def of_kind(self, kind):
+        return np.flatnonzero(self.alive[:self.count] & (self.kind[:self.count] == kind))
+
+    def lengths(self, indices):
+        """Lengths in image pixels of the given lines."""
+        x0, y0, x1, y1 = self.coords[indices].T
+        return np.hypot(x1 - x0, y1 - y0)
+
+    def move(self, index, start, end=None):
+        """Change an item's position (a prediction only uses start) and update it on the canvas."""
+        self._unindex(index)
+        end = start if end is None else end
+        self.coords[index] = (start[0], start[1], end[0], end[1])
+        self._index(index)
+        if index in self.drawn:
+            self._place(index)
+
+    def set_text(self, index, text):
+        self.text[index] = text
+        if index in self.drawn:
+            self.canvas.itemconfig(self.drawn[index][-1], text=text)
+
+    def remove(self, index):
+        """Delete one item from the store and the canvas."""
+        if not self.alive[index]:
+            return
+        self._unindex(index)
+        self.alive[index] = False
+        if index in self.drawn:
+            self._undraw(index)
+        if self.selected == index:
+            self.selected = None
+
+    def _cells(self, x0, y0, x1, y1):
+        c0, r0 = int(np.floor(min(x0, x1) / self.cell)), int(np.floor(min(y0, y1) / self.cell))
+        c1, r1 = int(np.floor(max(x0, x1) / self.cell)), int(np.floor(max(y0, y1) / self.cell))
+        return [(column, row) for column in range(c0, c1 + 1) for row in range(r0, r1 + 1)]
+
+    def _index(self, index):
+        for key in self._cells(*self.coords[index]):
+            self.grid.setdefault(key, set()).add(index)
+
+    def _unindex(self, index):
+        for key in self._cells(*self.coords[index]):
+            items = self.grid.get(key)
+            if items is not None:
+                items.discard(index)
+                if not items:
+                    del self.grid[key]
+
+    def query(self, box):
+        """Indices of the items whose bounding box overlaps the image-pixel box (x0, y0, x1, y1)."""
+        x0, y0, x1, y1 = box
+        c0, r0 = int(np.floor(x0 / self.cell)), int(np.floor(y0 / self.cell))
+        c1, r1 = int(np.floor(x1 / self.cell)), int(np.floor(y1 / self.cell))
+        if (c1 - c0 + 1) * (r1 - r0 + 1) > len(self.grid):  # Zoomed far out: scan the occupied cells instead
+            keys = [key for key in self.grid if c0 <= key[0] <= c1 and r0 <= key[1] <= r1]
+        else:
+            keys = [(column, row) for column in range(c0, c1 + 1) for row in range(r0, r1 + 1) if (column, row) in self.grid]
+        candidates = set()
+        for key in keys:
+            candidates |= self.grid[key]
+        if not candidates:
+            return np.empty(0, dtype=np.intp)
+        candidates = np.fromiter(candidates, dtype=np.intp, count=len(candidates))
+        c = self.coords[candidates]
+        inside = ((np.minimum(c[:, 0], c[:, 2]) <= x1) & (np.maximum(c[:, 0], c[:, 2]) >= x0)
+                  & (np.minimum(c[:, 1], c[:, 3]) <= y1) & (np.maximum(c[:, 1], c[:, 3]) >= y0))
+        return np.sort(candidates[inside])
+
+    def hit_test(self, x, y, tolerance):
+        """Index of the item nearest to image point (x, y) within tolerance image pixels, or None.
+
+        Lines and predictions are measured to the point, boxes to their
+        outline, so a line drawn inside a box can still be picked.
+        """
+        candidates = self.query((x - tolerance, y - tolerance, x + tolerance, y + tolerance))
+        if len(candidates) == 0:
+            return None
+        x0, y0, x1, y1 = self.coords[candidates].T
+        dx, dy = x1 - x0, y1 - y0
+        length2 = dx * dx + dy * dy
+        # Distance to the closest point of each segment; predictions are zero-length segments
+        t = np.clip(((x - x0) * dx + (y - y0) * dy) / np.where(length2 > 0, length2, 1), 0, 1)
+        distance = np.hypot(x0 + t * dx - x, y0 + t * dy - y)
+        is_box = self.kind[candidates] == BOX
+        if is_box.any():
+            left, right = np.minimum(x0, x1), np.maximum(x0, x1)
+            top, bottom = np.minimum(y0, y1), np.maximum(y0, y1)
+            outside = np.hypot(np.maximum.reduce([left - x, x - right, np.zeros_like(x0)]),
+                               np.maximum.reduce([top - y, y - bottom, np.zeros_like(y0)]))
+            inside = np.minimum.reduce([x - left, right - x, y - top, bottom - y])
+            distance = np.where(is_box, np.where(inside > 0, inside, outside), distance)
+        nearest = np.argmin(distance)
+        return int(candidates[nearest]) if distance[nearest] <= tolerance else None
+
+    def select(self, index):
+        """Highlight one item (None clears the selection)."""
+        previous, self.selected = self.selected, index
+        for item in (previous, index):
+            if item is not None and item in self.drawn:
+                self._style(item)
+
+    def _to_canvas(self, index):
+        scale, offset = self.view
+        x0, y0, x1, y1 = self.coords[index]
+        return x0 * scale + offset[0], y0 * scale + offset[1], x1 * scale + offset[0], y1 * scale + offset[1]
+
+    def _draw(self, index):
+        x0, y0, x1, y1 = self._to_canvas(index)
+        if self.kind[index] == LINE:
+            shape_id = self.canvas.create_line(x0, y0, x1, y1, fill=self.fill[index], tags=("line", self.tag))
+        elif self.kind[index] == BOX:
+            shape_id = self.canvas.create_rectangle(x0, y0, x1, y1, outline=self.fill[index], tags=("line", self.tag))
+        if self.kind[index] != PREDICTION:
+            label_id = self.canvas.create_text((x0 + x1) // 2, (y0 + y1) // 2, text=self.text[index], fill="black",
+                                               tags=("label", self.tag))
+            self.drawn[index] = (shape_id, label_id)
+        else:
+            self.drawn[index] = (self.canvas.create_text(x0, y0, text=self.text[index], fill=self.fill[index],
+                                                         tags=("prediction", self.tag)),)
+        if index == self.selected:
+            self._style(index)
+
+    def _place(self, index):
+        x0, y0, x1, y1 = self._to_canvas(index)
+        if self.kind[index] != PREDICTION:
+            shape_id, label_id = self.drawn[index]
+            self.canvas.coords(shape_id, x0, y0, x1, y1)
+            self.canvas.coords(label_id, (x0 + x1) // 2, (y0 + y1) // 2)
+        else:
+            self.canvas.coords(self.drawn[index][0], x0, y0)
+
+    def _style(self, index):
+        selected = index == self.selected
+        if self.kind[index] != PREDICTION:
+            self.canvas.itemconfig(self.drawn[index][0], width=3 if selected else 1)
+        else:
+            self.canvas.itemconfig(self.drawn[index][0], fill="orange" if selected else self.fill[index])
+
+    def _undraw(self, index):
+        for item in self.drawn.pop(index):
+            self.canvas.delete(item)
+
+    def render(self, scale, offset, size, moved=True):
+        """Draw the items inside a size (width, height) canvas at scale/offset and delete the others.
+
+        moved=False means the drawn items were already shifted to the new
+        offset (a pan with canvas.move), so only items entering or leaving
+        the view are touched.
+        """
+        self.view = (scale, offset)
+        left, top = (-offset[0] - self.margin) / scale, (-offset[1] - self.margin) / scale
+        right, bottom = (size[0] - offset[0] + self.margin) / scale, (size[1] - offset[1] + self.margin) / scale
+        visible = set(self.query((left, top, right, bottom)).tolist())
+        for index in [index for index in self.drawn if index not in visible]:
+            self._undraw(index)
+        for index in sorted(visible):
+            if index not in self.drawn:
+                self._draw(index)
+            elif moved:
+                self._place(index)
@@ -0,0 +1,128 @@
+import hashlib
+from collections import OrderedDict
+
+from startup import lazy_import
+
+np = lazy_import("numpy")
+Image = lazy_import("PIL.Image")
+
+
+def image_hash(img_array):
+    """Content hash of an image array, used to key cached estimates."""
+    digest = hashlib.blake2b(str(img_array.shape).encode(), digest_size=16)
+    digest.update(np.ascontiguousarray(img_array).data)
+    return digest.hexdigest()
+
+
+def downsample(img_array, max_side=512):
+    """Box-averaged copy whose longer side is at most max_side pixels, and the reduction factor."""
+    factor = max(1, int(np.ceil(max(img_array.shape[:2]) / max_side)))
+    if factor == 1:
+        return np.asarray(img_array), 1
+    return np.asarray(Image.fromarray(np.ascontiguousarray(img_array)).reduce(factor)), factor
+
+
+def substrate_color(pixels, bins=32):
+    """Substrate RGB of an (N, 3) pixel sample: the densest colour-histogram bin, refined by a robust median.
+
+    Bare substrate covers most of a flake image and is nearly uniform, so it
+    forms the tallest peak of the 3-D colour histogram even when flakes,
+    tape residue or dust take up a large part of the frame.
+    """
+    pixels = pixels.astype(np.float64)
+    width = 256 / bins
+    index = np.minimum((pixels // width).astype(np.intp), bins - 1)
+    flat = (index[:, 0] * bins + index[:, 1]) * bins + index[:, 2]
+    mode = np.unravel_index(np.argmax(np.bincount(flat, minlength=bins ** 3)), (bins,) * 3)
+    center = (np.array(mode) + 0.5) * width
+    for radius in (1.5 * width, None):
+        if radius is None:
+            # Second pass: keep pixels within 3 robust sigmas of the first estimate
+            distance = np.linalg.norm(pixels - center, axis=1)
+            radius = max(3 * 1.4826 * np.median(distance[distance < 1.5 * width]), 1.0)
+        near = np.linalg.norm(pixels - center, axis=1) < radius
+        if near.any():
+            center = np.median(pixels[near], axis=0)
+    return center
+
+
+class BackgroundMap:
+    """Smooth, spatially varying substrate colour for vignetting correction.
+
+    Each channel is a quadratic surface in normalized image coordinates,
+    fitted to the substrate pixels of a downsampled copy. Evaluate it at
+    image-pixel positions with at(), or per box / superpixel block.
+    """
+
+    def __init__(self, coefficients, width, height):
+        self.coefficients = coefficients  # (6, C)
+        self.width = width
+        self.height = height
+
+    @staticmethod
+    def features(u, v):
+        return np.stack([np.ones_like(u), u, v, u * u, u * v, v * v], axis=-1)
+
+    @classmethod
+    def fit(cls, small, factor, image_size, background_rgb, iterations=6, keep=0.5):
+        """Fit to the pixels of the downsampled copy that look like substrate.
+
+        small is the image reduced by factor; image_size is the (width, height)
+        of the full image, whose pixel coordinates the map is evaluated in.
+        Each pass refits to the keep fraction of pixels closest to the current
+        surface (trimmed least squares), so flakes never pull the fit.
+        """
+        width, height = image_size
+        v, u = np.mgrid[0:small.shape[0], 0:small.shape[1]]
+        design = cls.features((u.ravel() + 0.5) * factor * 2 / width - 1, (v.ravel() + 0.5) * factor * 2 / height - 1)
+        pixels = small.reshape(-1, small.shape[-1]).astype(np.float64)
+        coefficients = np.zeros((design.shape[1], pixels.shape[1]))
+        coefficients[0] = background_rgb  # Start from a flat background
+        for _ in range(iterations):
+            # Re-select substrate against the current surface, so darkened corners are kept once the fit bends
+            residual = np.linalg.norm(pixels - design @ coefficients, axis=1)
+            substrate = residual <= np.quantile(residual, keep)
+            if substrate.sum() < design.shape[1] * 4:
+                break
+            coefficients = np.linalg.lstsq(design[substrate], pixels[substrate], rcond=None)[0]
+        return cls(coefficients, width, height)
+
+    def at(self, x, y):
+        """Background RGB at image-pixel positions x, y (arrays of equal shape), shape (..., C)."""
+        u = (np.asarray(x, dtype=np.float64) + 0.5) * 2 / self.width - 1
+        v = (np.asarray(y, dtype=np.float64) + 0.5) * 2 / self.height - 1
+        return self.features(u, v) @ self.coefficients
+
+    def box(self, box):
+        """Background RGB at the centre of the (left, top, right, bottom) box."""
+        return self.at((box[0] + box[2] - 1) / 2, (box[1] + box[3] - 1) / 2)
+
+    def superpixel_rows(self, superpixel, r0, r1, width):
+        """Background of superpixel blocks in grid rows r0..r1, shape (r1 - r0, width, C)."""
+        y, x = np.mgrid[r0:r1, 0:width]
+        return self.at((x + 0.5) * superpixel - 0.5, (y + 0.5) * superpixel - 0.5)
+
+
+class BackgroundEstimator:
+    """Automatic substrate colour per image, computed once on a downsampled copy and cached by content hash."""
+
+    def __init__(self, max_side=512, bins=32, max_entries=64):
+        self.max_side = max_side
+        self.bins = bins
+        self.max_entries = max_entries
+        self.cache = OrderedDict()
+
+    def estimate(self, img_array):
+        """(background RGB, BackgroundMap) for the image."""
+        key = image_hash(img_array)
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        small, factor = downsample(img_array, self.max_side)
+        background_rgb = substrate_color(small.reshape(-1, small.shape[-1]), self.bins)
+        image_size = (img_array.shape[1], img_array.shape[0])
+        result = (background_rgb, BackgroundMap.fit(small, factor, image_size, background_rgb))
+        self.cache[key] = result
+        while len(self.cache) > self.max_entries:
+            self.cache.popitem(last=False)
+        return result
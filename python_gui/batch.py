@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# Headless contrast measurement and thickness prediction over a folder of images.
+#
+#   python batch.py IMAGE_DIR path/to/svm_model/model.json --background auto --output results.csv
+#   python batch.py IMAGE_DIR svm_model.m --background 10,10,200,200 --regions regions.csv
+#
+# --background is "auto", a pixel box "x0,y0,x1,y1" used in every image, or an RGB triple "r,g,b".
+# With "auto", --vignetting compares every block or box against the fitted local background.
+# Without --regions every image is segmented and the table gets one row per predicted class;
+# with --regions (a CSV with columns file,x0,y0,x1,y1) it gets one row per listed box.
+# Images are processed in parallel worker processes, each loading the model once.
+
+import argparse
+import csv
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import contrast_engine as engine
+
+COLUMNS = ["file", "region", "background_r", "background_g", "background_b", "mean_r", "mean_g", "mean_b",
+           "contrast_r", "contrast_g", "contrast_b", "prediction", "pixels", "error"]
+
+_worker_model = None
+
+
+def parse_background(spec):
+    """("auto", None), ("box", (x0, y0, x1, y1)) or ("rgb", array) from a --background value."""
+    if spec == "auto":
+        return "auto", None
+    values = [float(v) for v in spec.split(",")]
+    if len(values) == 4:
+        return "box", tuple(int(v) for v in values)
+    if len(values) == 3:
+        return "rgb", np.array(values)
+    raise ValueError(f"background must be 'auto', 'x0,y0,x1,y1' or 'r,g,b', got {spec!r}")
+
+
+def read_regions(path):
+    """Measurement boxes per file name from a CSV with columns file,x0,y0,x1,y1."""
+    regions = defaultdict(list)
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            regions[row["file"]].append(tuple(int(float(row[k])) for k in ("x0", "y0", "x1", "y1")))
+    return dict(regions)
+
+
+def find_images(image_dir, recursive=False):
+    """Image files under image_dir, sorted, as paths relative to it."""
+    found = []
+    for dirpath, dirnames, filenames in os.walk(image_dir):
+        for name in filenames:
+            if name.lower().endswith(engine.IMAGE_EXTENSIONS):
+                found.append(os.path.relpath(os.path.join(dirpath, name), image_dir))
+        if not recursive:
+            break
+    return sorted(found)
+
+
+def _init_worker(model_path):
+    global _worker_model
+    _worker_model = engine.load_model(model_path)
+
+
+def _row(name, region, background_rgb, mean_rgb, contrast_rgb, prediction, pixels):
+    return [name, region, *np.round(background_rgb, 3), *np.round(mean_rgb, 3), *np.round(contrast_rgb, 5),
+            prediction, pixels, ""]
+
+
+def measure_file(image_dir, name, background, boxes=None, superpixel=4, vignetting=False, model=None):
+    """Result rows for one image; errors become a single row so one bad file does not stop the batch."""
+    model = _worker_model if model is None else model
+    try:
+        img_array = engine.load_image(os.path.join(image_dir, name))
+        kind, value = background
+        background_map = None
+        if kind == "auto":
+            background_rgb, background_map = engine.estimate_background(img_array)
+            if not vignetting:
+                background_map = None
+        elif kind == "box":
+            background_rgb = engine.box_rgb(img_array, value)
+        else:
+            background_rgb = value
+        rows = []
+        if boxes is None:
+            for label, pixels, mean_rgb, contrast_rgb in engine.class_summary(img_array, background_rgb, model, superpixel, background_map):
+                rows.append(_row(name, f"class {label}", background_rgb, mean_rgb, contrast_rgb, label, pixels))
+        elif boxes:
+            means = np.array([engine.box_rgb(img_array, box) for box in boxes])
+            backgrounds = np.array([background_rgb if background_map is None else background_map.box(box) for box in boxes])
+            contrasts = engine.contrast(means, backgrounds)
+            labels = engine.predict(model, contrasts)  # One batched predict for all boxes of the image
+            for box, box_background, mean_rgb, contrast_rgb, label in zip(boxes, backgrounds, means, contrasts, labels):
+                pixels = max(0, box[2] - box[0]) * max(0, box[3] - box[1])
+                rows.append(_row(name, "box " + ",".join(map(str, box)), box_background, mean_rgb, contrast_rgb, label, pixels))
+        return rows
+    except Exception as exc:
+        return [[name] + [""] * (len(COLUMNS) - 2) + [f"{type(exc).__name__}: {exc}"]]
+
+
+def _measure(job):
+    return measure_file(*job)
+
+
+def run_batch(image_dir, model_path, output, background="auto", regions=None, superpixel=4, n_jobs=None, recursive=False,
+              vignetting=False):
+    """Measure every image in image_dir and write one consolidated CSV table; returns the number of rows."""
+    background = parse_background(background)
+    names = find_images(image_dir, recursive)
+    if regions is not None:
+        regions = read_regions(regions)
+        names = [name for name in names if name in regions]
+    jobs = [(image_dir, name, background, None if regions is None else regions[name], superpixel, vignetting)
+            for name in names]
+    if n_jobs is None:
+        n_jobs = os.cpu_count() or 1
+    count = 0
+    with open(output, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        with ProcessPoolExecutor(max_workers=int(n_jobs), initializer=_init_worker, initargs=(model_path,)) as pool:
+            # Rows are written as files finish, in input order, so an interrupted run keeps its results
+            for rows in pool.map(_measure, jobs, chunksize=4):
+                writer.writerows(rows)
+                count += len(rows)
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure contrast and predict thickness for a folder of images.")
+    parser.add_argument("image_dir")
+    parser.add_argument("model", help="model.json of an svm_model/ artifact, a lookup cube .npz or a joblib pickle")
+    parser.add_argument("--background", default="auto", help="'auto', a pixel box 'x0,y0,x1,y1' or an RGB triple 'r,g,b'")
+    parser.add_argument("--regions", help="CSV with columns file,x0,y0,x1,y1; measure these boxes instead of segmenting")
+    parser.add_argument("--output", default="results.csv")
+    parser.add_argument("--superpixel", type=int, default=4, help="pixels per side of each segmented block")
+    parser.add_argument("--jobs", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--recursive", action="store_true", help="include images in subdirectories")
+    parser.add_argument("--vignetting", action="store_true", help="with --background auto, correct for vignetting")
+    args = parser.parse_args()
+    rows = run_batch(args.image_dir, args.model, args.output, args.background, args.regions,
+                     args.superpixel, args.jobs, args.recursive, args.vignetting)
+    print(f"Wrote {rows} rows to {args.output}")
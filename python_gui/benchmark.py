@@ -0,0 +1,460 @@
+#!/usr/bin/env python
+# Reproducible benchmarks for the prediction, training and GUI measurement hot paths.
+#
+#   python benchmark.py                      # default sizes, appends to benchmark_results/history.jsonl
+#   python benchmark.py --quick --only line  # small sizes, only cases whose name contains "line"
+#
+# Every case runs on synthetic data generated from a fixed seed: flake images with
+# vignetting and noise, and labelled contrast datasets in the Contrast2.mat layout.
+# The GUI cases drive neo_gui.ImageApp methods headlessly through a stand-in canvas,
+# root and synchronous task executor, since Tk needs a display.
+# Each run appends one JSON record (environment plus per-case latency percentiles,
+# throughput and memory) to the history file and prints the change in median latency
+# against the previous record. peak_mb is the tracemalloc peak of one call, which
+# covers Python and NumPy buffers but not Pillow's or libsvm's own C allocations;
+# max_rss_mb is the process high-water mark after the case, which does include them
+# (null where neither resource nor psutil can report it).
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import numpy as np
+from PIL import Image
+from scipy.io import savemat
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "SVM"))
+import neo_gui
+import contrast_engine as engine
+from pyramid import ImagePyramid
+from svm_predict import svm_model
+from svm_train import TrainSVM, MakeModel
+
+SEED = 0
+HISTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_results", "history.jsonl")  # Ignored by git
+CLASS_CONTRAST = np.array([[0.0, 0.0, 0.0], [-0.08, -0.05, -0.03], [-0.18, -0.12, -0.07],
+                           [-0.30, -0.22, -0.12], [-0.45, -0.35, -0.20]])  # Substrate and four thickness classes
+SUBSTRATE_RGB = np.array([150.0, 130.0, 120.0])
+SIZES = {"image": [1024, 4096], "dataset": [1000, 4000], "pixels": [65536, 262144], "line": [100, 1000, 4000],
+         "annotations": [100, 1000], "pairs": [10, 100]}
+QUICK_SIZES = {"image": [512], "dataset": [500], "pixels": [16384], "line": [100, 1000], "annotations": [300],
+               "pairs": [50]}
+
+
+def synthetic_dataset(n, noise=0.01, seed=SEED):
+    """n labelled contrast triples around CLASS_CONTRAST, as (RGB_data (n, 3), labels (n,))."""
+    rng = np.random.default_rng(seed)
+    labels = rng.integers(0, len(CLASS_CONTRAST), n)
+    return CLASS_CONTRAST[labels] + rng.normal(0, noise, (n, 3)), labels
+
+
+def synthetic_image(size, flakes=12, seed=SEED):
+    """size x size RGB flake image: vignetted substrate, rectangular flakes of random class, sensor noise."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:size, 0:size] / (size / 2) - 1
+    image = SUBSTRATE_RGB * (1 - 0.1 * (x * x + y * y))[..., None]
+    for _ in range(flakes):
+        x0, y0 = rng.integers(0, size * 3 // 4, 2)
+        w, h = rng.integers(size // 20, size // 4, 2)
+        image[y0:y0 + h, x0:x0 + w] *= 1 + CLASS_CONTRAST[rng.integers(1, len(CLASS_CONTRAST))]
+    image += rng.normal(0, 2, image.shape)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+
+def write_contrast(path1, n):
+    """Write a Contrast2.mat training set (AllCon rows 0-2 contrast, row 4 label) for TrainSVM."""
+    rgb, labels = synthetic_dataset(n)
+    all_con = np.zeros((5, n))
+    all_con[0:3] = rgb.T
+    all_con[4] = labels
+    savemat(path1 + "Contrast2.mat", {"AllCon": all_con})
+
+
+def write_pixels(path, n):
+    """Write an im2_con.mat contrast image with n pixels for svm_model."""
+    rgb, _ = synthetic_dataset(n, seed=SEED + 1)
+    savemat(path + "im2_con.mat", {"im2_con": rgb[np.newaxis]})
+
+
+class Var:
+    """Stand-in for a Tk variable."""
+
+    def __init__(self, value=None):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        self.value = value
+
+
+class HeadlessCanvas:
+    """Records canvas items and scheduled callbacks instead of drawing them."""
+
+    def __init__(self, width=1280, height=960):
+        self.width, self.height = width, height
+        self.items = {}
+        self.next_id = 1
+        self.scheduled = {}
+
+    def _create(self, kind, *args, **kwargs):
+        item = self.next_id
+        self.next_id += 1
+        tags = kwargs.get("tags", kwargs.get("tag", ()))
+        self.items[item] = [kind, args, (tags,) if isinstance(tags, str) else tuple(tags)]
+        return item
+
+    def create_image(self, *args, **kwargs):
+        return self._create("image", *args, **kwargs)
+
+    def create_line(self, *args, **kwargs):
+        return self._create("line", *args, **kwargs)
+
+    def create_rectangle(self, *args, **kwargs):
+        return self._create("rectangle", *args, **kwargs)
+
+    def create_text(self, *args, **kwargs):
+        return self._create("text", *args, **kwargs)
+
+    def find_withtag(self, tag):
+        if isinstance(tag, int):
+            return (tag,) if tag in self.items else ()
+        return tuple(item for item, (_, _, tags) in self.items.items() if tag in tags)
+
+    def coords(self, tag, *args):
+        for item in self.find_withtag(tag):
+            self.items[item][1] = args
+
+    def delete(self, tag):
+        for item in self.find_withtag(tag):
+            del self.items[item]
+
+    def move(self, tag, dx, dy):
+        for item in self.find_withtag(tag):
+            args = self.items[item][1]
+            self.items[item][1] = tuple(v + (dx if i % 2 == 0 else dy) for i, v in enumerate(args))
+
+    def itemconfig(self, *args, **kwargs):
+        pass
+
+    def config(self, **kwargs):
+        pass
+
+    def bbox(self, *tags):
+        return None
+
+    def tag_raise(self, *args):
+        pass
+
+    def tag_lower(self, *args):
+        pass
+
+    def winfo_width(self):
+        return self.width
+
+    def winfo_height(self):
+        return self.height
+
+    def cget(self, option):
+        return {"width": self.width, "height": self.height}[option]
+
+    def after(self, ms, fn, *args):
+        job = f"after#{self.next_id}"
+        self.next_id += 1
+        self.scheduled[job] = (fn, args)
+        return job
+
+    def after_cancel(self, job):
+        self.scheduled.pop(job, None)
+
+    def run_scheduled(self):
+        """Run everything scheduled with after(), as if the delays had passed."""
+        while self.scheduled:
+            job = next(iter(self.scheduled))
+            fn, args = self.scheduled.pop(job)
+            fn(*args)
+
+
+class SyncExecutor:
+    """TaskExecutor stand-in that runs every job immediately on the calling thread."""
+
+    def submit(self, name, fn, *args, on_done=None, on_error=None, pass_task=False, **kwargs):
+        task = SimpleNamespace(name=name, cancel_event=None, set_progress=lambda fraction: None)
+        if pass_task:
+            kwargs["task"] = task
+        result = fn(*args, **kwargs)
+        if on_done is not None:
+            on_done(result)
+        return task
+
+    def cancel(self, name):
+        pass
+
+
+# Tk variables of neo_gui.ImageApp and their initial values; the rest of its
+# state comes from ImageApp.init_state
+VARIABLES = {"line_width": 1, "subpixel_enabled": False, "movement_enabled": True, "rgb_values": "",
+             "r_value": "", "g_value": "", "b_value": "", "auto_background": False, "vignetting_enabled": False,
+             "overlay_enabled": True, "status": "Ready", "timing_enabled": False}
+
+
+def headless_app(img_array, model=None, background_rgb=None):
+    """neo_gui.ImageApp with its Tk widgets replaced by stand-ins, loaded with img_array."""
+    app = neo_gui.ImageApp.__new__(neo_gui.ImageApp)  # Skip only the widget construction in __init__
+    app.canvas = HeadlessCanvas()
+    app.root = app.canvas
+    app.tasks = SyncExecutor()
+    for name, value in VARIABLES.items():
+        setattr(app, name, Var(value))
+    app.init_state(photo_factory=lambda region: region)  # Keep PIL images; PhotoImage needs a Tk display
+    app.show_loaded_image(app.index_image(ImagePyramid(img_array)))
+    app.model = model
+    app.background_rgb = background_rgb
+    return app
+
+
+def max_rss_mb():
+    """Peak resident memory of this process in MiB, or None where it cannot be read."""
+    if resource is not None:
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss / 2 ** 20 if sys.platform == "darwin" else rss / 1024  # Bytes on macOS, KiB on Linux
+    try:
+        import psutil
+    except ImportError:
+        return None
+    peak = getattr(psutil.Process().memory_info(), "peak_wset", None)  # Peak working set on Windows
+    return None if peak is None else peak / 2 ** 20
+
+
+def measure(fn, min_time=0.5, min_repeats=3, max_repeats=50):
+    """Latencies (s) of repeated fn() calls, then one more call under tracemalloc for the peak."""
+    fn()  # Warm-up: caches, lazy imports, first-touch page faults
+    latencies = []
+    start = time.perf_counter()
+    while len(latencies) < max_repeats and (len(latencies) < min_repeats or time.perf_counter() - start < min_time):
+        t0 = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - t0)
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return np.array(latencies), peak
+
+
+def result(name, size, latencies, peak, items, unit):
+    """One machine-readable case record; throughput is items per second at the median latency."""
+    p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+    return {"name": name, "size": size, "repeats": len(latencies), "mean_ms": 1e3 * latencies.mean(),
+            "p50_ms": 1e3 * p50, "p90_ms": 1e3 * p90, "p99_ms": 1e3 * p99,
+            "throughput": items / p50, "unit": unit, "peak_mb": peak / 2 ** 20,
+            "max_rss_mb": max_rss_mb()}
+
+
+def bench_train(sizes, workdir):
+    for n in sizes["dataset"]:
+        path1 = os.path.join(workdir, f"train_{n}") + os.sep
+        os.makedirs(path1, exist_ok=True)
+        write_contrast(path1, n)
+        latencies, peak = measure(lambda: TrainSVM(path1, 10, 10, 0.8, 0.2), min_repeats=1, max_repeats=5)
+        yield result("TrainSVM", n, latencies, peak, n, "samples/s")
+
+
+def bench_svm_model(sizes, workdir):
+    path1 = os.path.join(workdir, "model") + os.sep
+    os.makedirs(path1, exist_ok=True)
+    write_contrast(path1, sizes["dataset"][0])
+    TrainSVM(path1, 10, 10, 0.8, 0.2)
+    for n in sizes["pixels"]:
+        write_pixels(path1, n)
+        latencies, peak = measure(lambda: svm_model(path1), min_repeats=1, max_repeats=5)
+        yield result("svm_model", n, latencies, peak, n, "pixels/s")
+
+
+def trained_model(n=1000):
+    rgb, labels = synthetic_dataset(n)
+    return MakeModel(10, 10).fit(rgb, labels)
+
+
+def bench_line(sizes, workdir):
+    size = max(sizes["image"])
+    app = headless_app(synthetic_image(size))
+    for length in sizes["line"]:
+        length = min(length, size - 1)
+        line = [(0.0, size / 2), (length * 0.8, size / 2 + length * 0.6)]
+        for width in (1, 5):
+            app.line_width.set(width)
+            latencies, peak = measure(lambda: app.get_line_rgb(line, app.pixels.array))
+            yield result(f"get_line_rgb width={width}", length, latencies, peak, length, "px/s")
+
+
+def bench_box_prediction(sizes, workdir):
+    model = trained_model()
+    for size in sizes["image"]:
+        app = headless_app(synthetic_image(size), model, SUBSTRATE_RGB)
+        x0, y0 = 100, 100
+
+        def predict_box():
+            app.box_coords = [(x0, y0)]
+            app.end_box_prediction(SimpleNamespace(x=x0 + 200, y=y0 + 150))
+
+        latencies, peak = measure(predict_box)
+        yield result("box prediction", size, latencies, peak, 1, "boxes/s")
+
+
+def bench_zoom(sizes, workdir):
+    for size in sizes["image"]:
+        app = headless_app(synthetic_image(size))
+        state = {"step": 0}
+
+        def zoom():
+            # Alternate in and out so the view stays bounded; the settle pass runs the LANCZOS resample
+            state["step"] += 1
+            app.zoom_image(SimpleNamespace(x=640, y=480, delta=120 if state["step"] % 2 else -120))
+
+        def zoom_and_settle():
+            zoom()
+            app.canvas.run_scheduled()
+
+        app.renderer.cache_size = 0  # Every call resamples instead of hitting the view cache
+        latencies, peak = measure(zoom)
+        app.canvas.run_scheduled()
+        yield result("zoom_image fast", size, latencies, peak, 1, "zooms/s")
+        latencies, peak = measure(zoom_and_settle)
+        yield result("zoom_image settled", size, latencies, peak, 1, "zooms/s")
+
+
+def bench_annotations(sizes, workdir):
+    size = max(sizes["image"])
+    app = headless_app(synthetic_image(size))
+    rng = np.random.default_rng(SEED)
+    for n in sizes["annotations"]:
+        # n lines and n predictions spread over the image, viewed zoomed in on about a sixteenth of it
+        app.annotations.clear()
+        starts = rng.uniform(0, size, (n, 2))
+        ends = starts + rng.uniform(-size / 20, size / 20, (n, 2))
+        for start, end in zip(starts, ends):
+            app.annotations.set_text(app.annotations.add_line(start, end, "red"), app.line_label(len(app.annotations.number) - 1))
+        for center in rng.uniform(0, size, (n, 2)):
+            app.annotations.add_prediction(center, "1")
+        app.current_scale = 4 * 1280 / size
+        app.view_offset = (-size * app.current_scale / 4, -size * app.current_scale / 4)
+        app.redraw_image()
+        app.redraw_annotations()
+        state = {"step": 0}
+
+        def zoom():
+            state["step"] += 1
+            app.zoom_image(SimpleNamespace(x=640, y=480, delta=120 if state["step"] % 2 else -120))
+
+        latencies, peak = measure(zoom)
+        app.canvas.run_scheduled()
+        yield result("zoom_image annotations", n, latencies, peak, 1, "zooms/s")
+        points = rng.uniform(0, size, (256, 2))
+        latencies, peak = measure(lambda: [app.annotations.hit_test(x, y, 6) for x, y in points])
+        yield result("annotation hit_test", n, latencies, peak, len(points), "hits/s")
+
+
+def bench_contrast_table(sizes, workdir):
+    size = max(sizes["image"])
+    app = headless_app(synthetic_image(size))
+    rng = np.random.default_rng(SEED)
+    table = app.contrast_table
+    for n in sizes["pairs"]:
+        # n (background, sample) line pairs of about a tenth of the image, plus every line against one box
+        app.annotations.clear()
+        for start in rng.uniform(0, size * 0.9, (2 * n, 2)):
+            app.annotations.add_line(start, start + rng.uniform(0, size / 10, 2), "red")
+        app.annotations.add_box((10, 10, 60, 60), "purple")
+        lines = app.annotations.lines()
+
+        def per_line():
+            return [engine.line_rgb(app.pixels.array, app.annotations.line(index)) for index in lines]
+
+        def full():
+            table.invalidate()
+            table.sync()
+
+        def one_line():
+            table.invalidate(lines[0])
+            table.sync()
+
+        latencies, peak = measure(per_line)
+        yield result("contrast lines one by one", n, latencies, peak, 2 * n, "lines/s")
+        latencies, peak = measure(full)
+        yield result("contrast table full", n, latencies, peak, 2 * n, "lines/s")
+        latencies, peak = measure(one_line)
+        yield result("contrast table one line", n, latencies, peak, 1, "updates/s")
+
+
+CASES = {"train": bench_train, "svm_model": bench_svm_model, "line": bench_line,
+         "box": bench_box_prediction, "zoom": bench_zoom, "annotations": bench_annotations,
+         "contrast": bench_contrast_table}
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    import sklearn
+    return {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": commit, "python": platform.python_version(),
+            "numpy": np.__version__, "sklearn": sklearn.__version__, "pillow": Image.__version__,
+            "machine": platform.machine(), "system": platform.system(), "cpus": os.cpu_count()}
+
+
+def previous_record(history):
+    if not os.path.exists(history):
+        return None
+    with open(history) as f:
+        lines = [line for line in f if line.strip()]
+    return json.loads(lines[-1]) if lines else None
+
+
+def run(only=None, quick=False, history=HISTORY):
+    """Run the selected cases, print a table and append the record to the history file."""
+    sizes = QUICK_SIZES if quick else SIZES
+    before = previous_record(history)
+    baseline = {(r["name"], r["size"]): r for r in before["results"]} if before else {}
+    record = environment()
+    record["quick"] = quick
+    record["results"] = []
+    print(f"{'case':32s} {'size':>8s} {'p50 ms':>10s} {'p90 ms':>10s} {'p99 ms':>10s} {'throughput':>22s} {'peak MB':>8s} {'vs last':>8s}")
+    with tempfile.TemporaryDirectory() as workdir:
+        for key, bench in CASES.items():
+            if only and not any(o in key for o in only):
+                continue
+            for r in bench(sizes, workdir):
+                record["results"].append(r)
+                old = baseline.get((r["name"], r["size"]))
+                change = f"{r['p50_ms'] / old['p50_ms'] - 1:+.0%}" if old else ""
+                print(f"{r['name']:32s} {r['size']:8d} {r['p50_ms']:10.3f} {r['p90_ms']:10.3f} {r['p99_ms']:10.3f} "
+                      f"{r['throughput']:12.4g} {r['unit']:>9s} {r['peak_mb']:8.1f} {change:>8s}")
+    record["max_rss_mb"] = max_rss_mb()
+    os.makedirs(os.path.dirname(os.path.abspath(history)), exist_ok=True)
+    with open(history, "a") as f:
+        f.write(json.dumps(record) + "\n")
+    return record
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the SVM and GUI measurement hot paths on synthetic data.")
+    parser.add_argument("--only", nargs="*", help=f"run only these cases: {', '.join(CASES)}")
+    parser.add_argument("--quick", action="store_true", help="small sizes for a fast smoke run")
+    parser.add_argument("--history", default=HISTORY, help="JSON Lines file the run is appended to")
+    args = parser.parse_args()
+    run(args.only, args.quick, args.history)
@@ -0,0 +1,101 @@
+import os
+import sys
+
+from startup import lazy_import
+
+np = lazy_import("numpy")
+Image = lazy_import("PIL.Image")
+
+from line_profile import line_profile
+from segmentation import segment_image, superpixel_contrast
+from background import BackgroundEstimator
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "SVM"))
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".tif", ".tiff", ".bmp")
+
+
+def load_image(file_path):
+    """Decode an image file into an RGB uint8 array at native resolution."""
+    with Image.open(file_path) as image:
+        return np.asarray(image.convert('RGB'))
+
+
+def load_model(model_path):
+    """Load a thickness model: svm_model/ artifact (model.json), lookup cube (.npz) or joblib pickle."""
+    if model_path.endswith(".json"):
+        from svm_artifact import load_artifact
+        return load_artifact(model_path)  # Memory-mapped svm_model/ artifact from TrainSVM
+    elif model_path.endswith(".npz"):
+        from svm_lut import LookupClassifier
+        return LookupClassifier.load(model_path)  # Compiled lookup cube from CompileSVM
+    import joblib
+    return joblib.load(model_path)  # Reads svm_model.m from TrainSVM as well as plain pickles
+
+
+def line_rgb(img_array, line, width=1, bilinear=False):
+    """Average RGB along a line ((x0, y0), (x1, y1)) in image pixels, over a strip width pixels wide."""
+    return line_profile(img_array, line[0], line[1], width=width, bilinear=bilinear).mean(axis=0)
+
+
+def line_contrast(background_rgb, sample_rgb):
+    """Per-channel contrast |sample - background| / background between two line averages."""
+    background_rgb = np.asarray(background_rgb, dtype=np.float64)
+    return np.abs(np.asarray(sample_rgb, dtype=np.float64) - background_rgb) / background_rgb
+
+
+def box_rgb(img_array, box):
+    """Mean RGB over the (left, top, right, bottom) pixel box, clipped to the image."""
+    height, width = img_array.shape[:2]
+    left, top = max(0, int(box[0])), max(0, int(box[1]))
+    right, bottom = min(width, int(box[2])), min(height, int(box[3]))
+    region = img_array[top:bottom, left:right]
+    if region.size == 0:
+        return np.full(img_array.shape[2:], np.nan)
+    return region.reshape(-1, region.shape[-1]).mean(axis=0)
+
+
+def contrast(rgb, background_rgb):
+    """Signed per-channel contrast (rgb - background) / background, the model's input."""
+    background_rgb = np.asarray(background_rgb, dtype=np.float64)
+    return (np.asarray(rgb, dtype=np.float64) - background_rgb) / background_rgb
+
+
+def predict(model, contrast_rgb):
+    """Thickness label(s) for one contrast triple or an (N, 3) array of them."""
+    contrast_rgb = np.asarray(contrast_rgb, dtype=np.float64)
+    labels = np.asarray(model.predict(contrast_rgb.reshape(-1, contrast_rgb.shape[-1])))
+    return labels[0] if contrast_rgb.ndim == 1 else labels
+
+
+_estimator = BackgroundEstimator()
+
+
+def estimate_background(img_array):
+    """Automatic substrate colour and vignetting map (background RGB, BackgroundMap), cached per image."""
+    return _estimator.estimate(img_array)
+
+
+def class_summary(img_array, background_rgb, model, superpixel=4, background_map=None):
+    """Segment the whole image and summarize each predicted class.
+
+    Returns a list of (label, pixels, mean_rgb, contrast_rgb) with pixels
+    counted in image pixels, ordered by label. mean_rgb is reconstructed
+    against background_rgb, so with a background_map it is the
+    vignetting-corrected colour.
+    """
+    labels = segment_image(img_array, background_rgb, model, superpixel, background_map=background_map)
+    background = background_rgb
+    if background_map is not None:
+        background = background_map.superpixel_rows(superpixel, 0, labels.shape[0], labels.shape[1])
+    contrast_grid = superpixel_contrast(img_array, background, superpixel, 0, labels.shape[0])
+    flat_labels = labels.ravel()
+    flat_contrast = contrast_grid.reshape(-1, contrast_grid.shape[-1])
+    background_rgb = np.asarray(background_rgb, dtype=np.float64)
+    summary = []
+    for label in np.unique(flat_labels):
+        mask = flat_labels == label
+        mean_contrast = flat_contrast[mask].mean(axis=0)
+        summary.append((label, int(mask.sum()) * superpixel * superpixel,
+                        background_rgb * (1 + mean_contrast), mean_contrast))
+    return summary
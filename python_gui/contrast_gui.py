@@ -1,7 +1,11 @@
 import tkinter as tk  # Import the tkinter library for GUI components
 from tkinter import filedialog  # Import filedialog for file selection dialog
-from PIL import Image, ImageTk  # Import Pillow for image handling
-import numpy as np  # Import numpy for numerical operations
+from startup import lazy_import, run_app  # Import helpers that defer heavy modules until the window is up
+Image = lazy_import("PIL.Image")  # Import Pillow for image handling, loaded on first use
+ImageTk = lazy_import("PIL.ImageTk")  # Import ImageTk to show images on the canvas, loaded on first use
+np = lazy_import("numpy")  # Import numpy for numerical operations, loaded on first use
+from image_store import PixelStore  # Import PixelStore for the cached image array
+from line_profile import line_profile  # Import line_profile for pixel-exact line sampling
 
 class ImageApp:
     def __init__(self, root):
@@ -48,6 +52,7 @@ class ImageApp:
         # Variables to store line coordinates and drawing state
         self.line_coords = []  # List to store coordinates of the lines
         self.image = None  # Variable to store the loaded image
+        self.pixels = None  # PixelStore with the NumPy view of the loaded image
         self.photo = None  # Variable to store the PhotoImage
         self.lines = []  # List to store line IDs
         
@@ -64,6 +69,7 @@ class ImageApp:
         if file_path:
             self.image = Image.open(file_path).convert('RGB')  # Open and convert image to RGB
             self.image.thumbnail((1280, 960))  # Resize image to fit within 256x192 while maintaining aspect ratio
+            self.pixels = PixelStore(np.asarray(self.image))  # Convert to a NumPy array once per image
             self.photo = ImageTk.PhotoImage(self.image)  # Convert image to PhotoImage
             self.canvas.create_image(0, 0, image=self.photo, anchor=tk.NW)  # Display image on canvas
             self.canvas.config(scrollregion=self.canvas.bbox(tk.ALL))  # Configure scroll region
@@ -80,20 +86,19 @@ class ImageApp:
         if self.drawing_enabled:
             self.drawing_active = True  # Set drawing_active flag to True
             self.current_line_start = (event.x, event.y)  # Store the starting coordinates of the line
-            self.current_line_id = None  # Initialize current_line_id to None
+            # Rubber-band line that is reshaped in place while dragging
+            self.current_line_id = self.canvas.create_line(self.current_line_start, (event.x, event.y), fill="red" if len(self.line_coords) % 2 == 0 else "blue")
 
     def draw_line(self, event):
         """Draw a line as the mouse moves."""
         if self.drawing_active:
-            if self.current_line_id:
-                self.canvas.delete(self.current_line_id)  # Delete the previous line segment
-            # Draw the new line segment
-            self.current_line_id = self.canvas.create_line(self.current_line_start, (event.x, event.y), fill="red" if len(self.line_coords) % 2 == 0 else "blue")
+            self.canvas.coords(self.current_line_id, *self.current_line_start, event.x, event.y)  # Move the free end of the line
 
     def end_line(self, event):
         """Finish drawing the line when the mouse button is released."""
         if self.drawing_active:
             self.drawing_active = False  # Set drawing_active flag to False
+            self.canvas.coords(self.current_line_id, *self.current_line_start, event.x, event.y)  # End exactly at the release point
             # Store the line coordinates
             self.line_coords.append([self.current_line_start, (event.x, event.y)])
             self.lines.append(self.current_line_id)  # Store the line ID
@@ -115,7 +120,7 @@ class ImageApp:
 
     def calculate_rgb_and_contrast(self):
         """Calculate and display the average RGB values and contrast for the drawn lines."""
-        img_array = np.array(self.image)  # Convert image to numpy array
+        img_array = self.pixels.array  # Cached NumPy view of the image, no copy
         if len(self.line_coords) < 2:
             return  # Return if less than two lines are drawn
         
@@ -137,14 +142,12 @@ class ImageApp:
 
     def get_line_rgb(self, line_coords, img_array):
         """Get the average RGB values along a line."""
-        # Generate x and y values along the line
-        x_values = np.linspace(line_coords[0][0], line_coords[1][0], num=1000).astype(int)
-        y_values = np.linspace(line_coords[0][1], line_coords[1][1], num=1000).astype(int)
-        rgb_values = img_array[y_values, x_values]  # Get RGB values from the image array
+        # Sample each pixel the line crosses exactly once
+        rgb_values = line_profile(img_array, line_coords[0], line_coords[1])  # Get RGB values from the image array
         avg_rgb = np.mean(rgb_values, axis=0).astype(int)  # Calculate the average RGB values
         return avg_rgb  # Return the average RGB values
 
 if __name__ == "__main__":
     root = tk.Tk()  # Create the main window
     app = ImageApp(root)  # Create an instance of the ImageApp class
-    root.mainloop()  # Run the main event loop
+    run_app(root, ["numpy", "PIL.Image", "PIL.ImageTk"])  # Run the main event loop, finishing imports once the window is up
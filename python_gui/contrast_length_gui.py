@@ -1,7 +1,12 @@
 import tkinter as tk
 from tkinter import filedialog
-from PIL import Image, ImageTk, ImageOps
-import numpy as np
+from startup import lazy_import, run_app
+np = lazy_import("numpy")  # NumPy and Pillow load on first use so the window appears immediately
+Image = lazy_import("PIL.Image")
+from image_store import PixelStore
+from viewport import ViewportRenderer
+from frames import FrameCoalescer
+import contrast_engine as engine
 
 class ImageApp:
     def __init__(self, root):
@@ -61,7 +66,7 @@ class ImageApp:
         self.line_coords = []
         self.original_line_coords = []
         self.image = None
-        self.photo = None
+        self.pixels = None  # PixelStore of the loaded image, replaced on every load
         self.lines = []
         self.line_labels = []
         
@@ -78,6 +83,10 @@ class ImageApp:
         self.start_x = 0
         self.start_y = 0
         self.current_scale = 1.0  # Initial scale of the image
+        self.view_offset = (0.0, 0.0)  # Canvas position of the image origin
+        self.pending_pan = (0, 0)  # Drag distance not yet applied to the canvas
+        self.frames = FrameCoalescer(root)  # At most one pan/rubber-band update per display frame
+        self.renderer = ViewportRenderer(self.canvas)  # Renders only the visible part of the image
 
         # Bind right-click and mouse wheel events for moving and zooming the image
         self.canvas.bind("<ButtonPress-3>", self.start_move)
@@ -90,10 +99,12 @@ class ImageApp:
         if file_path:
             self.image = Image.open(file_path).convert('RGB')  # Open and convert image to RGB
             self.image.thumbnail((1280, 960), Image.Resampling.LANCZOS)  # Resize image to fit within 1280x960 while maintaining aspect ratio
-            self.photo = ImageTk.PhotoImage(self.image)  # Convert image to PhotoImage
-            if self.image_id:
-                self.canvas.delete(self.image_id)
-            self.image_id = self.canvas.create_image(0, 0, image=self.photo, anchor=tk.NW, tags="image")  # Display image on canvas
+            self.pixels = PixelStore(np.asarray(self.image))  # Convert to a NumPy array once per image
+            self.current_scale = 1.0
+            self.view_offset = (0.0, 0.0)
+            self.renderer.set_source(self.image)
+            self.renderer.render(self.current_scale, self.view_offset)  # Display image on canvas
+            self.image_id = self.renderer.image_id
             self.canvas.config(scrollregion=self.canvas.bbox(tk.ALL))  # Configure scroll region
 
     def enable_drawing(self):
@@ -107,24 +118,28 @@ class ImageApp:
         """Start a new line when the mouse button is pressed."""
         if self.drawing_enabled:
             self.drawing_active = True  # Set drawing_active flag to True
-            self.current_line_start = (event.x / self.current_scale, event.y / self.current_scale)  # Store the starting coordinates of the line
-            self.current_line_id = None  # Initialize current_line_id to None
+            self.current_line_start = self.canvas_to_image(event.x, event.y)  # Store the starting coordinates of the line
+            # Rubber-band line, reshaped in place while dragging and kept as the finished line
+            self.current_line_id = self.canvas.create_line(event.x, event.y, event.x, event.y, fill="red" if len(self.line_coords) % 2 == 0 else "blue",
+                                                           tags=("line", "annotation"))
 
     def draw_line(self, event):
         """Draw a line as the mouse moves."""
         if self.drawing_active:
-            scaled_start = (self.current_line_start[0] * self.current_scale, self.current_line_start[1] * self.current_scale)
-            current_coords = (event.x, event.y)
-            if self.current_line_id:
-                self.canvas.delete(self.current_line_id)  # Delete the previous line segment
-            # Draw the new line segment
-            self.current_line_id = self.canvas.create_line(scaled_start, current_coords, fill="red" if len(self.line_coords) % 2 == 0 else "blue", tags="line")
+            self.frames.schedule("line", lambda: self.stretch_line(event.x, event.y))
+
+    def stretch_line(self, x, y):
+        """Move the free end of the rubber-band line to canvas point (x, y)."""
+        scaled_start = self.image_to_canvas(*self.current_line_start)
+        self.canvas.coords(self.current_line_id, scaled_start[0], scaled_start[1], x, y)
 
     def end_line(self, event):
         """Finish drawing the line when the mouse button is released."""
         if self.drawing_active:
+            self.frames.flush()  # Apply any motion still waiting for the next frame
             self.drawing_active = False  # Set drawing_active flag to False
-            end_coords = (event.x / self.current_scale, event.y / self.current_scale)
+            self.stretch_line(event.x, event.y)
+            end_coords = self.canvas_to_image(event.x, event.y)
             # Store the line coordinates
             self.line_coords.append([self.current_line_start, end_coords])
             self.original_line_coords.append([self.current_line_start, end_coords])
@@ -135,11 +150,11 @@ class ImageApp:
             micrometer_length = line_length / self.pixel_to_micrometer_ratio
             # Add a text label showing the line number and length
             line_number = len(self.line_coords)
-            scaled_start = (self.current_line_start[0] * self.current_scale, self.current_line_start[1] * self.current_scale)
-            scaled_end = (end_coords[0] * self.current_scale, end_coords[1] * self.current_scale)
+            scaled_start = self.image_to_canvas(*self.current_line_start)
+            scaled_end = self.image_to_canvas(*end_coords)
             label_id = self.canvas.create_text((scaled_start[0] + scaled_end[0]) // 2,
                                                (scaled_start[1] + scaled_end[1]) // 2,
-                                               text=f"{line_number}: {micrometer_length:.2f} {'μm' if self.pixel_to_micrometer_ratio != 1 else 'px'}", fill="black", tags="label")
+                                               text=f"{line_number}: {micrometer_length:.2f} {'μm' if self.pixel_to_micrometer_ratio != 1 else 'px'}", fill="black", tags=("label", "annotation"))
             self.line_labels.append(label_id)
             self.current_line_id = None  # Reset current_line_id to None
             if len(self.line_coords) == 2:
@@ -163,7 +178,7 @@ class ImageApp:
 
     def calculate_rgb_and_contrast(self):
         """Calculate and display the average RGB values and contrast for the drawn lines."""
-        img_array = np.array(self.image)  # Convert image to numpy array
+        img_array = self.pixels.array  # Cached NumPy view of the image, no copy
         if len(self.line_coords) < 2:
             return  # Return if less than two lines are drawn
         
@@ -171,7 +186,7 @@ class ImageApp:
         line2_rgb = self.get_line_rgb(self.line_coords[1], img_array)  # Get RGB values for the second line
         
         # Calculate contrast between the two lines for each RGB channel
-        contrast = [abs(line2_rgb[i] - line1_rgb[i]) / line1_rgb[i] for i in range(3)]
+        contrast = engine.line_contrast(line1_rgb, line2_rgb)
         # Set the result text
         result_text = (f"Average RGB Line 1 (background): {line1_rgb}\n"
                        f"Average RGB Line 2 (sample): {line2_rgb}\n"
@@ -185,13 +200,18 @@ class ImageApp:
 
     def get_line_rgb(self, line_coords, img_array):
         """Get the average RGB values along a line."""
-        # Generate x and y values along the line
-        x_values = np.linspace(line_coords[0][0], line_coords[1][0], num=1000).astype(int)
-        y_values = np.linspace(line_coords[0][1], line_coords[1][1], num=1000).astype(int)
-        rgb_values = img_array[y_values, x_values]  # Get RGB values from the image array
-        avg_rgb = np.mean(rgb_values, axis=0).astype(int)  # Calculate the average RGB values
+        # Sample each pixel the line crosses exactly once
+        avg_rgb = engine.line_rgb(img_array, line_coords).astype(int)  # Calculate the average RGB values
         return avg_rgb  # Return the average RGB values
 
+    def image_to_canvas(self, x, y):
+        """Convert image pixel coordinates to canvas coordinates."""
+        return (x * self.current_scale + self.view_offset[0], y * self.current_scale + self.view_offset[1])
+
+    def canvas_to_image(self, x, y):
+        """Convert canvas coordinates to image pixel coordinates."""
+        return ((x - self.view_offset[0]) / self.current_scale, (y - self.view_offset[1]) / self.current_scale)
+
     def start_move(self, event):
         """Start moving the image when the right mouse button is pressed."""
         self.start_x = event.x
@@ -200,40 +220,44 @@ class ImageApp:
     def move_image(self, event):
         """Move the image on the canvas."""
         if  self.movement_enabled.get():
-            dx = event.x - self.start_x
-            dy = event.y - self.start_y
-            self.canvas.move(self.image_id, dx, dy)
-            for line_id in self.lines:
-                self.canvas.move(line_id, dx, dy)
-            for label_id in self.line_labels:
-                self.canvas.move(label_id, dx, dy)
+            # Accumulate the drag and apply it once per frame
+            self.pending_pan = (self.pending_pan[0] + event.x - self.start_x, self.pending_pan[1] + event.y - self.start_y)
             self.start_x = event.x
             self.start_y = event.y
+            self.frames.schedule("pan", self.apply_pan)
+
+    def apply_pan(self):
+        """Shift the view by the accumulated drag distance."""
+        dx, dy = self.pending_pan
+        self.pending_pan = (0, 0)
+        self.view_offset = (self.view_offset[0] + dx, self.view_offset[1] + dy)
+        self.canvas.move("annotation", dx, dy)  # One tag-based move for all lines and labels
+        self.renderer.render(self.current_scale, self.view_offset, fast=True)  # Fill in newly exposed areas
+        self.image_id = self.renderer.image_id
 
     def zoom_image(self, event):
         """Zoom the image in or out with the mouse wheel."""
-        if  self.movement_enabled.get():
+        if self.movement_enabled.get() and self.image is not None:
+            self.frames.flush()  # Land any pending pan before rescaling about the cursor
+            factor = 1.0
             if event.delta > 0:  # Zoom in
-                self.current_scale *= 1.1
+                factor = 1.1
             elif event.delta < 0:  # Zoom out
-                self.current_scale /= 1.1
-
-            # Resize the image
-            new_size = (int(self.image.width * self.current_scale), int(self.image.height * self.current_scale))
-            resized_image = self.image.resize(new_size, Image.Resampling.LANCZOS)
-            self.photo = ImageTk.PhotoImage(resized_image)
+                factor = 1 / 1.1
+            self.current_scale *= factor
+            # Keep the image point under the cursor in place
+            self.view_offset = (event.x - (event.x - self.view_offset[0]) * factor,
+                                event.y - (event.y - self.view_offset[1]) * factor)
 
-            # Redraw the image on the canvas
-            if self.image_id:
-                self.canvas.delete(self.image_id)
-            self.image_id = self.canvas.create_image(0, 0, image=self.photo, anchor=tk.NW, tags="image")
-            self.canvas.config(scrollregion=self.canvas.bbox(tk.ALL))
+            # Resample only the visible region, fast now and LANCZOS once the wheel settles
+            self.renderer.render(self.current_scale, self.view_offset, fast=True)
+            self.image_id = self.renderer.image_id
 
             # Move and scale lines and labels
             for i, (start, end) in enumerate(self.original_line_coords):
                 if self.lines[i] is not None:
-                    scaled_start = (start[0] * self.current_scale, start[1] * self.current_scale)
-                    scaled_end = (end[0] * self.current_scale, end[1] * self.current_scale)
+                    scaled_start = self.image_to_canvas(*start)
+                    scaled_end = self.image_to_canvas(*end)
                     self.canvas.coords(self.lines[i], scaled_start[0], scaled_start[1], scaled_end[0], scaled_end[1])
                     line_length = np.sqrt((end[0] - start[0]) ** 2 + (end[1] - start[1]) ** 2)
                     micrometer_length = line_length / self.pixel_to_micrometer_ratio
@@ -266,4 +290,4 @@ class ImageApp:
 if __name__ == "__main__":
     root = tk.Tk()  # Create the main window
     app = ImageApp(root)  # Create an instance of the ImageApp class
-    root.mainloop()  # Run the main event loop
+    run_app(root, ["numpy", "PIL.Image", "PIL.ImageTk"])  # Run the main event loop, finishing imports once the window is up
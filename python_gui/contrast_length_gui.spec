@@ -0,0 +1,37 @@
+# -*- mode: python ; coding: utf-8 -*-
+# PyInstaller build for contrast_length_gui.py, tuned for start-up time.
+#
+#   pyinstaller contrast_length_gui.spec                             # one-dir: dist/contrast_length_gui/contrast_length_gui.exe, fastest start
+#   set BUNDLE_MODE=onefile && pyinstaller contrast_length_gui.spec  # single dist/contrast_length_gui.exe, unpacks on every start
+#
+# numpy and PIL are imported through startup.lazy_import, which PyInstaller cannot
+# see, so they are listed as hidden imports. The excludes drop modules the old
+# build dragged in without using them; fewer modules is a smaller archive to open
+# and, for one-file builds, less to unpack before the window can appear.
+# Time a build with: python startup.py dist/contrast_length_gui/contrast_length_gui.exe --runs 5
+import os
+
+MODE = os.environ.get("BUNDLE_MODE", "onedir").strip()
+
+EXCLUDES = [
+    "xml", "xmlrpc", "http", "pydoc_data", "doctest", "pdb", "sqlite3", "tarfile", "ftplib", "webbrowser",
+    "numpy.distutils", "PIL.ImageQt", "PyQt5", "PyQt6", "PySide2", "PySide6", "matplotlib", "IPython", "pandas",
+    # No model loading in this GUI; these come in through sklearn / joblib / numpy's test helpers
+    "scipy", "sklearn", "joblib", "multiprocessing", "psutil", "asyncio", "unittest", "email", "html", "pydoc",
+    "ssl", "numpy.f2py", "numpy.testing",
+]
+
+a = Analysis(
+    ["contrast_length_gui.py"],
+    pathex=[SPECPATH, os.path.join(SPECPATH, "SVM")],
+    hiddenimports=["numpy", "PIL.Image", "PIL.ImageTk"],
+    excludes=EXCLUDES,
+    noarchive=False,
+)
+pyz = PYZ(a.pure)
+
+if MODE == "onefile":
+    exe = EXE(pyz, a.scripts, a.binaries, a.datas, [], name="contrast_length_gui", console=False, upx=False)
+else:
+    exe = EXE(pyz, a.scripts, [], exclude_binaries=True, name="contrast_length_gui", console=False, upx=False)
+    coll = COLLECT(exe, a.binaries, a.datas, name="contrast_length_gui", upx=False)
@@ -0,0 +1,98 @@
+import csv
+
+from startup import lazy_import
+
+np = lazy_import("numpy")
+
+from annotations import BOX
+from image_store import pixel_box
+from line_profile import line_means
+import contrast_engine as engine
+
+COLUMNS = ["pair", "sample", "background", "sample_r", "sample_g", "sample_b",
+           "background_r", "background_g", "background_b", "contrast_r", "contrast_g", "contrast_b"]
+
+
+class ContrastTable:
+    """Contrast of many line pairs and line-vs-box pairs from an AnnotationStore, updated incrementally.
+
+    Rows follow the store: consecutive lines form (background, sample) pairs,
+    1-2, 3-4, ... as they are drawn red then blue, and every line is also
+    compared with every reference box. The mean RGB of each line or box is
+    cached by annotation index. sync() samples all lines missing from the
+    cache in one batched gather (line_means), takes box means from the
+    tile summed-area table, and evaluates the contrast of all rows as array
+    operations. Editing one line therefore resamples that line only: call
+    invalidate(index) and sync() again.
+    """
+
+    def __init__(self, annotations, pixels=None):
+        self.annotations = annotations
+        self.pixels = pixels
+        self.settings = None  # (line width, bilinear) the cached means were sampled with
+        self.means = np.empty((0, 3))
+        self.rows = []  # (sample name, background name) per row
+        self.sample_rgb = self.background_rgb = self.contrast = np.empty((0, 3))
+
+    def set_pixels(self, pixels):
+        """Measure a new image; every cached mean is dropped."""
+        self.pixels = pixels
+        self.invalidate()
+
+    def invalidate(self, index=None):
+        """Forget the cached mean of one moved line or box, or of all of them."""
+        if index is None:
+            self.means[:] = np.nan
+        elif index < len(self.means):
+            self.means[index] = np.nan
+
+    def sync(self, width=1, bilinear=False):
+        """Bring the rows up to date; returns the number of lines and boxes that had to be measured."""
+        store = self.annotations
+        if (width, bilinear) != self.settings:
+            self.settings = (width, bilinear)
+            self.invalidate()
+        if len(self.means) < store.count:
+            grown = np.full((max(16, 2 * store.count), 3), np.nan)
+            grown[:len(self.means)] = self.means
+            self.means = grown
+        lines, boxes = store.lines(), store.boxes()
+        if self.pixels is None:
+            lines, boxes = lines[:0], boxes[:0]
+        measured = 0
+        missing = lines[np.isnan(self.means[lines, 0])]
+        if len(missing):
+            self.means[missing] = line_means(self.pixels.array, store.coords[missing], width, bilinear)
+            measured += len(missing)
+        for index in boxes[np.isnan(self.means[boxes, 0])]:
+            box = pixel_box(*store.coords[index], self.pixels.shape)
+            self.means[index] = self.pixels.box_mean(box)  # From the tile summed-area table
+            measured += 1
+        pairs = len(lines) // 2
+        background = np.concatenate([lines[0:2 * pairs:2], np.repeat(boxes, len(lines))]).astype(np.intp)
+        sample = np.concatenate([lines[1:2 * pairs:2], np.tile(lines, len(boxes))]).astype(np.intp)
+        self.rows = [(self.name(s), self.name(b)) for s, b in zip(sample, background)]
+        self.sample_rgb = self.means[sample]
+        self.background_rgb = self.means[background]
+        self.contrast = engine.line_contrast(self.background_rgb, self.sample_rgb)
+        return measured
+
+    def name(self, index):
+        """Label of a line or box in the table, e.g. "line 3" or "box 1"."""
+        return ("box " if self.annotations.kind[index] == BOX else "line ") + str(self.annotations.number[index])
+
+    def records(self):
+        """Rows in COLUMNS order."""
+        return [[row + 1, sample, background, *np.round(sample_rgb, 3).tolist(), *np.round(background_rgb, 3).tolist(),
+                 *np.round(contrast, 5).tolist()]
+                for row, ((sample, background), sample_rgb, background_rgb, contrast)
+                in enumerate(zip(self.rows, self.sample_rgb, self.background_rgb, self.contrast))]
+
+    def write_csv(self, path):
+        """Write the table as CSV; returns the number of rows."""
+        records = self.records()
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(COLUMNS)
+            writer.writerows(records)
+        return len(records)
@@ -0,0 +1,39 @@
+FRAME_MS = 16  # About one display refresh at 60 Hz
+
+
+class FrameCoalescer:
+    """Collapse bursts of motion events into at most one canvas update per frame.
+
+    Handlers call schedule(key, callback) on every event; only the latest
+    callback per key runs, once, on the next frame. flush() runs pending
+    callbacks immediately, e.g. before a button release or a zoom that must
+    see the up-to-date view.
+    """
+
+    def __init__(self, root, interval_ms=FRAME_MS):
+        self.root = root
+        self.interval_ms = interval_ms
+        self.pending = {}
+        self.job = None
+
+    def schedule(self, key, callback):
+        self.pending[key] = callback
+        if self.job is None:
+            self.job = self.root.after(self.interval_ms, self._run)
+
+    def _run(self):
+        self.job = None
+        pending, self.pending = self.pending, {}
+        for callback in pending.values():
+            callback()
+
+    def flush(self):
+        if self.job is not None:
+            self.root.after_cancel(self.job)
+            self._run()
+
+    def cancel(self):
+        if self.job is not None:
+            self.root.after_cancel(self.job)
+            self.job = None
+        self.pending = {}
@@ -0,0 +1,131 @@
+from startup import lazy_import
+
+np = lazy_import("numpy")
+
+TILE = 16  # Pixels per side of the tiles summarized by the box-sum tables
+
+
+def pixel_box(x0, y0, x1, y1, shape):
+    """Integer (left, top, right, bottom) box of the pixels whose centres lie between two image-space corners.
+
+    Pixel i covers [i, i + 1), so both edges round to the nearest pixel
+    boundary; the result is clipped to an image of the given shape.
+    """
+    height, width = shape[:2]
+    left, right = sorted((int(np.floor(x0 + 0.5)), int(np.floor(x1 + 0.5))))
+    top, bottom = sorted((int(np.floor(y0 + 0.5)), int(np.floor(y1 + 0.5))))
+    return (min(width, max(0, left)), min(height, max(0, top)), min(width, max(0, right)), min(height, max(0, bottom)))
+
+
+class PixelStore:
+    """Read-only NumPy view of the loaded image, created once per image.
+
+    Measurements slice self.array instead of converting the PIL image each
+    time. Derived float variants are computed on first use and cached for
+    the lifetime of the store; loading a new image creates a new store.
+    """
+
+    def __init__(self, array):
+        self.array = np.asarray(array)
+        if self.array.flags.writeable:
+            self.array.flags.writeable = False
+        self.variants = {}
+
+    @property
+    def shape(self):
+        return self.array.shape
+
+    def crop(self, box):
+        """View of the (left, top, right, bottom) pixel box, clipped to the image."""
+        height, width = self.array.shape[:2]
+        left, top = max(0, box[0]), max(0, box[1])
+        right, bottom = min(width, box[2]), min(height, box[3])
+        return self.array[top:bottom, left:right]
+
+    def float32(self):
+        """Pixels as float32 in 0..255."""
+        if "float32" not in self.variants:
+            variant = self.array.astype(np.float32)
+            variant.flags.writeable = False
+            self.variants["float32"] = variant
+        return self.variants["float32"]
+
+    def normalized(self):
+        """Pixels as float32 in 0..1."""
+        if "normalized" not in self.variants:
+            variant = self.float32() / np.float32(255)
+            variant.flags.writeable = False
+            self.variants["normalized"] = variant
+        return self.variants["normalized"]
+
+    def integral(self, squared=False):
+        """Per-channel summed-area table of TILE x TILE tile sums, (H // TILE + 1, W // TILE + 1, C) int64.
+
+        Holds the pixels or their squares summed over whole tiles only, so it
+        takes 1/32 of the uint8 image's memory rather than eight times it;
+        box_sum adds the partial tiles along a box's edges from the pixels.
+        """
+        key = "integral_sq" if squared else "integral"
+        if key not in self.variants:
+            height, width = self.array.shape[:2]
+            rows, cols = height // TILE, width // TILE
+            channels = self.array.shape[2:]
+            table = np.zeros((rows + 1, cols + 1) + channels, dtype=np.int64)
+            for r0 in range(0, rows, 32):  # Bands of 32 tile rows keep the temporaries small
+                r1 = min(rows, r0 + 32)
+                block = self.array[r0 * TILE:r1 * TILE, :cols * TILE]
+                if squared:
+                    block = block.astype(np.uint32)  # 255 ** 2 * TILE ** 2 still fits, summed as int64 below
+                    block *= block
+                table[r0 + 1:r1 + 1, 1:] = block.reshape((r1 - r0, TILE, cols, TILE) + channels).sum(axis=(1, 3), dtype=np.int64)
+            table = np.cumsum(np.cumsum(table, axis=0), axis=1)
+            table.flags.writeable = False
+            self.variants[key] = table
+        return self.variants[key]
+
+    def _direct_sum(self, top, bottom, left, right, squared):
+        region = self.array[top:bottom, left:right]
+        if region.size == 0:
+            return np.zeros(self.array.shape[2:], dtype=np.int64)
+        if squared:
+            region = region.astype(np.int64)
+            return (region * region).sum(axis=(0, 1))
+        return region.sum(axis=(0, 1), dtype=np.int64)
+
+    def box_sum(self, box, squared=False):
+        """Per-channel sum over the (left, top, right, bottom) box, and its pixel count.
+
+        Whole tiles inside the box come from the tile table in O(1); only the
+        strips of partial tiles along the edges (under TILE pixels deep) are
+        summed from the pixels, so the cost follows the box perimeter.
+        """
+        height, width = self.array.shape[:2]
+        left, top = min(width, max(0, int(box[0]))), min(height, max(0, int(box[1])))
+        right, bottom = max(left, min(width, int(box[2]))), max(top, min(height, int(box[3])))
+        count = (right - left) * (bottom - top)
+        table = self.integral(squared)
+        c0, c1 = -(-left // TILE), min(right // TILE, table.shape[1] - 1)
+        r0, r1 = -(-top // TILE), min(bottom // TILE, table.shape[0] - 1)
+        if c1 <= c0 or r1 <= r0:  # No whole tile inside
+            return self._direct_sum(top, bottom, left, right, squared), count
+        x0, x1, y0, y1 = c0 * TILE, c1 * TILE, r0 * TILE, r1 * TILE
+        total = table[r1, c1] - table[r0, c1] - table[r1, c0] + table[r0, c0]
+        total = total + self._direct_sum(top, y0, left, right, squared) + self._direct_sum(y1, bottom, left, right, squared)
+        total += self._direct_sum(y0, y1, left, x0, squared) + self._direct_sum(y0, y1, x1, right, squared)
+        return total, count
+
+    def box_mean(self, box):
+        """Per-channel mean over the box (NaN for an empty box)."""
+        total, count = self.box_sum(box)
+        if count == 0:
+            return np.full(total.shape, np.nan)
+        return total / count
+
+    def box_stats(self, box):
+        """Per-channel mean and variance over the box, using the squared-value table."""
+        total, count = self.box_sum(box)
+        if count == 0:
+            return np.full(total.shape, np.nan), np.full(total.shape, np.nan)
+        total_sq, _ = self.box_sum(box, squared=True)
+        mean = total / count
+        return mean, np.maximum(total_sq / count - mean ** 2, 0.0)
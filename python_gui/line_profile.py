@@ -0,0 +1,95 @@
+from startup import lazy_import
+
+np = lazy_import("numpy")
+
+
+def sample_points(start, end, bilinear=False):
+    """Sample positions (x, y) along a line, one per pixel step.
+
+    Without bilinear the samples step one pixel along the major axis, so every
+    pixel the line crosses is visited exactly once. With bilinear the samples
+    are spaced one pixel apart along the line itself.
+    """
+    dx, dy = end[0] - start[0], end[1] - start[1]
+    if bilinear:
+        n = int(np.ceil(np.hypot(dx, dy))) + 1
+    else:
+        n = int(round(max(abs(dx), abs(dy)))) + 1
+    t = np.linspace(0.0, 1.0, n)
+    return start[0] + t * dx, start[1] + t * dy
+
+
+def strip_offsets(start, end, width):
+    """Perpendicular (x, y) offsets for a strip width pixels wide centred on the line."""
+    if width <= 1:
+        return np.zeros(1), np.zeros(1)
+    dx, dy = end[0] - start[0], end[1] - start[1]
+    length = np.hypot(dx, dy)
+    nx, ny = (-dy / length, dx / length) if length else (0.0, 1.0)
+    steps = np.arange(int(width)) - (int(width) - 1) / 2
+    return steps * nx, steps * ny
+
+
+def gather(img_array, x, y, bilinear=False):
+    """Pixel values at float positions, clamped to the image; nearest pixel or bilinear.
+
+    Positions use the canvas convention: pixel i covers [i, i + 1) and its
+    centre is at i + 0.5, so the nearest pixel is floor(x) and bilinear
+    weights are measured from the pixel centres.
+    """
+    height, width = img_array.shape[:2]
+    if not bilinear:
+        xi = np.clip(np.floor(x).astype(np.intp), 0, width - 1)
+        yi = np.clip(np.floor(y).astype(np.intp), 0, height - 1)
+        return img_array[yi, xi].astype(np.float64)
+    x = np.clip(np.asarray(x) - 0.5, 0, width - 1)
+    y = np.clip(np.asarray(y) - 0.5, 0, height - 1)
+    x0 = np.minimum(np.floor(x).astype(np.intp), width - 2) if width > 1 else np.zeros(x.shape, np.intp)
+    y0 = np.minimum(np.floor(y).astype(np.intp), height - 2) if height > 1 else np.zeros(y.shape, np.intp)
+    x1, y1 = np.minimum(x0 + 1, width - 1), np.minimum(y0 + 1, height - 1)
+    fx, fy = (x - x0)[..., None], (y - y0)[..., None]
+    top = img_array[y0, x0] * (1 - fx) + img_array[y0, x1] * fx
+    bottom = img_array[y1, x0] * (1 - fx) + img_array[y1, x1] * fx
+    return top * (1 - fy) + bottom * fy
+
+
+def line_profile(img_array, start, end, width=1, bilinear=False):
+    """RGB profile along the line, shape (samples, channels), averaged across the strip width."""
+    x, y = sample_points(start, end, bilinear)
+    ox, oy = strip_offsets(start, end, width)
+    values = gather(img_array, x[:, None] + ox[None, :], y[:, None] + oy[None, :], bilinear)
+    return values.mean(axis=1)
+
+
+def line_means(img_array, lines, width=1, bilinear=False):
+    """Mean RGB of many lines at once, shape (N, channels); lines is (N, 4) rows of x0, y0, x1, y1.
+
+    Gives line_profile(...).mean(axis=0) for every line, but the sample
+    positions of all lines are built as one array, gathered from the image
+    in one indexing operation and reduced per line with np.add.reduceat.
+    """
+    lines = np.asarray(lines, dtype=np.float64).reshape(-1, 4)
+    if len(lines) == 0:
+        return np.empty((0,) + img_array.shape[2:])
+    x0, y0, x1, y1 = lines.T
+    dx, dy = x1 - x0, y1 - y0
+    if bilinear:
+        counts = np.ceil(np.hypot(dx, dy)).astype(np.intp) + 1
+    else:
+        counts = np.rint(np.maximum(np.abs(dx), np.abs(dy))).astype(np.intp) + 1
+    starts = np.cumsum(counts) - counts
+    owner = np.repeat(np.arange(len(lines)), counts)  # Line of each sample
+    # Same positions as sample_points: t = k / (n - 1), ending exactly on the end point
+    t = (np.arange(counts.sum()) - starts[owner]) * (1.0 / np.maximum(counts - 1, 1))[owner]
+    t[(starts + counts - 1)[counts > 1]] = 1.0
+    x, y = x0[owner] + t * dx[owner], y0[owner] + t * dy[owner]
+    if width <= 1:
+        ox, oy = np.zeros((len(lines), 1)), np.zeros((len(lines), 1))
+    else:
+        length = np.hypot(dx, dy)
+        safe = np.where(length > 0, length, 1)
+        nx, ny = np.where(length > 0, -dy / safe, 0.0), np.where(length > 0, dx / safe, 1.0)
+        steps = np.arange(int(width)) - (int(width) - 1) / 2
+        ox, oy = nx[:, None] * steps, ny[:, None] * steps
+    values = gather(img_array, x[:, None] + ox[owner], y[:, None] + oy[owner], bilinear).mean(axis=1)
+    return np.add.reduceat(values, starts, axis=0) / counts[:, None]
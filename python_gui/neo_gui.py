@@ -1,8 +1,28 @@
 import tkinter as tk
 from tkinter import filedialog, messagebox
-from PIL import Image, ImageTk, ImageOps
-import numpy as np
-import pickle
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "SVM"))
+from startup import lazy_import, run_app
+np = lazy_import("numpy")  # NumPy and Pillow load on first use so the window appears immediately
+Image = lazy_import("PIL.Image")
+from viewport import ViewportRenderer
+from pyramid import ImagePyramid
+from image_store import PixelStore, pixel_box
+from line_profile import line_profile
+from segmentation import segment_image, label_overlay
+from tasks import TaskExecutor
+from frames import FrameCoalescer
+from background import BackgroundEstimator
+from annotations import AnnotationStore, PREDICTION, LINE
+from contrast_table import ContrastTable
+import contrast_engine as engine
+from svm_predict import PALETTE
+import svm_trace
+from svm_trace import span
+
+PYRAMID_CACHE_DIR = None  # Directory for reduced pyramid levels of large images, None keeps them in memory only
 
 class ImageApp:
     def __init__(self, root):
@@ -24,6 +44,19 @@ class ImageApp:
         # Button to clear drawings
         self.btn_clear = tk.Button(control_frame, text="Clear Drawings", command=self.clear_drawings)
         self.btn_clear.pack()
+
+        # Buttons to select, drag and delete individual lines and predictions
+        self.btn_edit = tk.Button(control_frame, text="Edit Annotations", command=self.enable_editing)
+        self.btn_edit.pack()
+        self.btn_delete = tk.Button(control_frame, text="Delete Selected", command=self.delete_selected)
+        self.btn_delete.pack()
+        root.bind("<Delete>", lambda event: self.delete_selected())
+
+        # Contrast of every line pair and of every line against reference boxes, in an exportable table
+        self.btn_reference_box = tk.Button(control_frame, text="Reference Box", command=self.enable_reference_box)
+        self.btn_reference_box.pack()
+        self.btn_contrast_table = tk.Button(control_frame, text="Contrast Table", command=self.show_contrast_table)
+        self.btn_contrast_table.pack()
         
         # Entry and button for pixel-to-micrometer ratio
         self.ratio_label = tk.Label(control_frame, text="Pixel to Micrometer Ratio:")
@@ -32,6 +65,18 @@ class ImageApp:
         self.ratio_entry.pack()
         self.ratio_button = tk.Button(control_frame, text="Confirm Ratio", command=self.confirm_ratio)
         self.ratio_button.pack()
+
+        # Line width (pixels averaged perpendicular to the line) and sub-pixel sampling
+        self.line_width = tk.IntVar(value=1)
+        self.width_label = tk.Label(control_frame, text="Line Width (px):")
+        self.width_label.pack()
+        self.width_spinbox = tk.Spinbox(control_frame, from_=1, to=50, textvariable=self.line_width, width=5,
+                                        command=self.update_contrast_table)
+        self.width_spinbox.pack()
+        self.subpixel_enabled = tk.BooleanVar()
+        self.subpixel_check = tk.Checkbutton(control_frame, text="Sub-pixel Sampling", variable=self.subpixel_enabled,
+                                             command=self.update_contrast_table)
+        self.subpixel_check.pack()
         
         # Checkbutton to enable image movement
         self.movement_enabled = tk.BooleanVar()
@@ -66,51 +111,142 @@ class ImageApp:
         # Button to set background
         self.btn_set_background = tk.Button(control_frame, text="Set Background", command=self.set_background)
         self.btn_set_background.pack(pady=5)
+
+        # Estimate the substrate colour automatically on load; optionally correct vignetting with a fitted map
+        self.auto_background = tk.BooleanVar(value=True)
+        self.auto_background_check = tk.Checkbutton(control_frame, text="Auto Background", variable=self.auto_background, command=self.toggle_auto_background)
+        self.auto_background_check.pack()
+        self.vignetting_enabled = tk.BooleanVar(value=False)
+        self.vignetting_check = tk.Checkbutton(control_frame, text="Correct Vignetting", variable=self.vignetting_enabled)
+        self.vignetting_check.pack()
         
         # Button to enable prediction mode
         self.btn_predict = tk.Button(control_frame, text="Predict", command=self.enable_prediction)
         self.btn_predict.pack(pady=20)
-        
-        # Variables to store line coordinates and drawing state
-        self.line_coords = []
-        self.original_line_coords = []
-        self.image = None
-        self.photo = None
-        self.lines = []
-        self.line_labels = []
-        self.predictions = []
+
+        # Button to classify the whole image and checkbutton to show the label overlay
+        self.btn_segment = tk.Button(control_frame, text="Segment Image", command=self.segment_image)
+        self.btn_segment.pack(pady=5)
+        self.overlay_enabled = tk.BooleanVar(value=True)
+        self.overlay_check = tk.Checkbutton(control_frame, text="Show Segmentation", variable=self.overlay_enabled, command=self.toggle_overlay)
+        self.overlay_check.pack()
+
+        # Progress of background jobs (image decode, model load, resampling, prediction)
+        self.status = tk.StringVar(value="Ready")
+        self.status_label = tk.Label(control_frame, textvariable=self.status)
+        self.status_label.pack(pady=5)
+
+        # Opt-in timing spans (also enabled by the SVM_TRACE environment variable) and their live panel
+        self.timing_enabled = tk.BooleanVar(value=svm_trace.tracer.enabled)
+        self.timing_check = tk.Checkbutton(control_frame, text="Record Timing", variable=self.timing_enabled, command=self.toggle_timing)
+        self.timing_check.pack()
+        self.btn_timing = tk.Button(control_frame, text="Timing Panel", command=self.show_timing_panel)
+        self.btn_timing.pack(pady=5)
+        self.timing_window = None
+        self.tasks = TaskExecutor(root, status=self.status)
+
+        # Create a canvas to display the image with fixed size
+        self.canvas = tk.Canvas(root, width=1280, height=960)
+        self.canvas.pack(side=tk.LEFT)
+        self.init_state()
+
+        # Bind right-click and mouse wheel events for moving and zooming the image
+        self.canvas.bind("<ButtonPress-3>", self.start_move)
+        self.canvas.bind("<B3-Motion>", self.move_image)
+        self.canvas.bind("<MouseWheel>", self.zoom_image)
+
+        # Closing the window cancels background jobs; their pool threads would otherwise keep the process alive
+        root.protocol("WM_DELETE_WINDOW", self.close)
+
+    def close(self):
+        """Cancel running jobs and destroy the window."""
+        self.tasks.shutdown()
+        self.root.destroy()
+
+    def init_state(self, photo_factory=None):
+        """Set up everything but the widgets; needs self.root, self.canvas and self.tasks.
+
+        photo_factory is passed to the viewport renderers (see
+        ViewportRenderer); benchmark.py calls this with stand-ins for Tk.
+        """
+        self.prediction_count = 0
+
+        # Drawing state; the lines and predictions themselves live in self.annotations
+        self.image = None  # ImagePyramid of the loaded image at native resolution
+        self.pixels = None  # PixelStore with the native-resolution pixels, replaced on every load
+        self.edit_drag = None  # (item index, grabbed part, last image point) while dragging in edit mode
         self.model = None
         self.background_rgb = None
+        self.background_map = None  # BackgroundMap of the automatic estimate, None for a manual background
+        self.background_estimator = BackgroundEstimator()  # Caches estimates by image content hash
+        self.auto_estimate = None  # (background RGB, BackgroundMap) of the loaded image
         self.drawing_enabled = False
         self.drawing_active = False
         self.pixel_to_micrometer_ratio = 1.0  # Default ratio
-
-        # Create a canvas to display the image with fixed size
-        self.canvas = tk.Canvas(root, width=1280, height=960)
-        self.canvas.pack(side=tk.LEFT)
+        self.annotations = AnnotationStore(self.canvas)  # Lines and predictions in image pixels, drawn only where visible
+        self.contrast_table = ContrastTable(self.annotations)  # Measured only while its window is open
+        self.contrast_window = None
 
         # Variables for image movement
         self.image_id = None
         self.start_x = 0
         self.start_y = 0
         self.current_scale = 1.0  # Initial scale of the image
+        self.view_offset = (0.0, 0.0)  # Canvas position of the image origin
+        self.pending_pan = (0, 0)  # Drag distance not yet applied to the canvas
+        self.frames = FrameCoalescer(self.root)  # At most one pan/rubber-band update per display frame
+        self.renderer = ViewportRenderer(self.canvas, executor=self.tasks,
+                                         photo_factory=photo_factory)  # Renders only the visible part of the image
 
-        # Bind right-click and mouse wheel events for moving and zooming the image
-        self.canvas.bind("<ButtonPress-3>", self.start_move)
-        self.canvas.bind("<B3-Motion>", self.move_image)
-        self.canvas.bind("<MouseWheel>", self.zoom_image)
+        # Segmentation overlay: label maps cached per (image, model, background), drawn above the image
+        self.segment_superpixel = 4  # Pixels per side of each classified block
+        self.segment_cache = {}
+        self.overlay = None  # (overlay PIL image, superpixel size) for the current image
+        self.overlay_renderer = ViewportRenderer(self.canvas, fast_filter="nearest",
+                                                 final_filter="nearest", tag="overlay", above="image",
+                                                 executor=self.tasks, photo_factory=photo_factory)
 
     def load_image(self):
         """Load an image and display it on the canvas."""
         file_path = filedialog.askopenfilename(filetypes=[("Image files", "*.jpg *.png")])
         if file_path:
-            self.image = Image.open(file_path).convert('RGB')  # Open and convert image to RGB
-            self.image.thumbnail((1280, 960), Image.Resampling.LANCZOS)  # Resize image to fit within 1280x960 while maintaining aspect ratio
-            self.photo = ImageTk.PhotoImage(self.image)  # Convert image to PhotoImage
-            if self.image_id:
-                self.canvas.delete(self.image_id)
-            self.image_id = self.canvas.create_image(0, 0, image=self.photo, anchor=tk.NW, tags="image")  # Display image on canvas
-            self.canvas.config(scrollregion=self.canvas.bbox(tk.ALL))  # Configure scroll region
+            # Decode and index the image off the Tk thread; a newer load supersedes this one
+            self.tasks.submit("load image", self.open_image, file_path, on_done=self.show_loaded_image,
+                              on_error=lambda exc: messagebox.showerror("Error", f"Could not load image: {exc}"))
+
+    def open_image(self, file_path):
+        """Decode the image and build its pixel store (runs on a worker thread)."""
+        with span("image load", "gui", path=file_path):
+            image = ImagePyramid.open(file_path, cache_dir=PYRAMID_CACHE_DIR)  # Open at native resolution
+        return self.index_image(image)
+
+    def index_image(self, image):
+        """Pixel store, box-sum tables and background estimate of a decoded ImagePyramid, for show_loaded_image."""
+        with span("array conversion", "gui"):
+            pixels = PixelStore(image.base)  # Shared read-only array for all measurements
+            pixels.integral()  # Tile sums for box means and the live box readout, built here rather than on the Tk thread
+            pixels.integral(squared=True)
+        with span("background estimate", "gui"):
+            estimate = self.background_estimator.estimate(pixels.array)  # Substrate colour from a downsampled copy
+        return image, pixels, estimate
+
+    def show_loaded_image(self, result):
+        """Install a decoded image and display it on the canvas."""
+        self.image, self.pixels, self.auto_estimate = result
+        self.background_rgb = self.background_map = None
+        if self.auto_background.get():
+            self.apply_auto_background()
+        # Fit the image within 1280x960 while maintaining aspect ratio; measurements stay in native pixels
+        self.current_scale = min(1.0, 1280 / self.image.width, 960 / self.image.height)
+        self.view_offset = (0.0, 0.0)
+        self.renderer.set_source(self.image)
+        self.segment_cache.clear()
+        self.set_overlay(None)
+        self.contrast_table.set_pixels(self.pixels)
+        self.update_contrast_table()
+        self.redraw_image()  # Display image on canvas
+        self.redraw_annotations()  # Existing measurements follow the new view
+        self.canvas.config(scrollregion=self.canvas.bbox(tk.ALL))  # Configure scroll region
 
     def enable_drawing(self):
         """Enable drawing mode."""
@@ -123,57 +259,206 @@ class ImageApp:
         """Start a new line when the mouse button is pressed."""
         if self.drawing_enabled:
             self.drawing_active = True  # Set drawing_active flag to True
-            self.current_line_start = (event.x / self.current_scale, event.y / self.current_scale)  # Store the starting coordinates of the line
-            self.current_line_id = None  # Initialize current_line_id to None
+            self.current_line_start = self.canvas_to_image(event.x, event.y)  # Store the starting coordinates of the line
+            # Rubber-band line, reshaped in place while dragging and kept as the finished line
+            self.current_line_id = self.canvas.create_line(event.x, event.y, event.x, event.y, fill="red" if len(self.annotations.lines()) % 2 == 0 else "blue",
+                                                           tags=("line", "annotation"))
 
     def draw_line(self, event):
         """Draw a line as the mouse moves."""
         if self.drawing_active:
-            scaled_start = (self.current_line_start[0] * self.current_scale, self.current_line_start[1] * self.current_scale)
-            current_coords = (event.x, event.y)
-            if self.current_line_id:
-                self.canvas.delete(self.current_line_id)  # Delete the previous line segment
-            # Draw the new line segment
-            self.current_line_id = self.canvas.create_line(scaled_start, current_coords, fill="red" if len(self.line_coords) % 2 == 0 else "blue", tags="line")
+            self.frames.schedule("line", lambda: self.stretch_line(event.x, event.y))
+
+    def stretch_line(self, x, y):
+        """Move the free end of the rubber-band line to canvas point (x, y)."""
+        scaled_start = self.image_to_canvas(*self.current_line_start)
+        self.canvas.coords(self.current_line_id, scaled_start[0], scaled_start[1], x, y)
 
     def end_line(self, event):
         """Finish drawing the line when the mouse button is released."""
         if self.drawing_active:
+            self.frames.flush()  # Apply any motion still waiting for the next frame
             self.drawing_active = False  # Set drawing_active flag to False
-            end_coords = (event.x / self.current_scale, event.y / self.current_scale)
-            # Store the line coordinates
-            self.line_coords.append([self.current_line_start, end_coords])
-            self.original_line_coords.append([self.current_line_start, end_coords])
-            self.lines.append(self.current_line_id)  # Store the line ID
-            # Calculate the length of the line
-            line_length = np.sqrt((end_coords[0] - self.current_line_start[0]) ** 2 + 
-                                  (end_coords[1] - self.current_line_start[1]) ** 2)
-            micrometer_length = line_length / self.pixel_to_micrometer_ratio
-            # Add a text label showing the line number and length
-            line_number = len(self.line_coords)
-            scaled_start = (self.current_line_start[0] * self.current_scale, self.current_line_start[1] * self.current_scale)
-            scaled_end = (end_coords[0] * self.current_scale, end_coords[1] * self.current_scale)
-            label_id = self.canvas.create_text((scaled_start[0] + scaled_end[0]) // 2,
-                                               (scaled_start[1] + scaled_end[1]) // 2,
-                                               text=f"{line_number}: {micrometer_length:.2f} {'μm' if self.pixel_to_micrometer_ratio != 1 else 'px'}", fill="black", tags="label")
-            self.line_labels.append(label_id)
+            end_coords = self.canvas_to_image(event.x, event.y)
+            # The store draws the finished line and its length label in place of the rubber band
+            fill = "red" if len(self.annotations.lines()) % 2 == 0 else "blue"
+            self.canvas.delete(self.current_line_id)
             self.current_line_id = None  # Reset current_line_id to None
-            if len(self.line_coords) == 2:
+            index = self.annotations.add_line(self.current_line_start, end_coords, fill)
+            self.annotations.set_text(index, self.line_label(index))
+            self.redraw_annotations(moved=False)
+            self.update_contrast_table()
+            if len(self.annotations.lines()) == 2:
                 self.calculate_rgb_and_contrast()  # Calculate RGB values and contrast if two lines are drawn
 
+    def line_label(self, index):
+        """Label text of a line: its number and length in micrometres (or pixels without a ratio)."""
+        micrometer_length = self.annotations.lengths([index])[0] / self.pixel_to_micrometer_ratio
+        return f"{self.annotations.number[index]}: {micrometer_length:.2f} {'μm' if self.pixel_to_micrometer_ratio != 1 else 'px'}"
+
+    def redraw_annotations(self, moved=True):
+        """Draw the annotations inside the view; moved=False after a pan or when only adding items."""
+        self.annotations.render(self.current_scale, self.view_offset, self.renderer.canvas_size(), moved=moved)
+
+    def enable_editing(self):
+        """Enable edit mode: click selects the nearest line or prediction, dragging moves it or a line end."""
+        self.drawing_enabled = False
+        self.predict_mode = False
+        self.canvas.bind("<ButtonPress-1>", self.start_edit)
+        self.canvas.bind("<B1-Motion>", self.drag_edit)
+        self.canvas.bind("<ButtonRelease-1>", self.end_edit)
+
+    def start_edit(self, event):
+        """Select the annotation under the cursor and remember which part was grabbed."""
+        point = self.canvas_to_image(event.x, event.y)
+        tolerance = 6 / self.current_scale  # Six screen pixels at any zoom
+        index = self.annotations.hit_test(point[0], point[1], tolerance)
+        self.annotations.select(index)
+        self.edit_drag = None
+        if index is None:
+            return
+        part = "all"
+        if self.annotations.kind[index] != PREDICTION:  # Line ends and box corners can be dragged on their own
+            start, end = self.annotations.line(index)
+            if np.hypot(point[0] - start[0], point[1] - start[1]) <= tolerance:
+                part = "start"
+            elif np.hypot(point[0] - end[0], point[1] - end[1]) <= tolerance:
+                part = "end"
+        self.edit_drag = (index, part, point)
+
+    def drag_edit(self, event):
+        """Move the grabbed annotation with the mouse, once per frame."""
+        if self.edit_drag is not None:
+            self.frames.schedule("edit", lambda: self.apply_edit(event.x, event.y))
+
+    def apply_edit(self, x, y):
+        """Move the grabbed line end, line or prediction to follow canvas point (x, y)."""
+        index, part, last = self.edit_drag
+        point = self.canvas_to_image(x, y)
+        start, end = self.annotations.line(index)
+        if part == "start":
+            start = point
+        elif part == "end":
+            end = point
+        else:
+            dx, dy = point[0] - last[0], point[1] - last[1]
+            start, end = (start[0] + dx, start[1] + dy), (end[0] + dx, end[1] + dy)
+        self.annotations.move(index, start, end)
+        if self.annotations.kind[index] == LINE:
+            self.annotations.set_text(index, self.line_label(index))
+        self.edit_drag = (index, part, point)
+
+    def end_edit(self, event):
+        """Finish a drag and refresh the contrast readout if a measured line changed."""
+        self.frames.flush()
+        if self.edit_drag is not None:
+            self.contrast_table.invalidate(self.edit_drag[0])  # Only the moved line or box is measured again
+            self.update_contrast_table()
+            if self.edit_drag[0] in self.annotations.lines()[:2]:
+                self.calculate_rgb_and_contrast()
+        self.edit_drag = None
+
+    def delete_selected(self):
+        """Delete the selected line, box or prediction."""
+        index = self.annotations.selected
+        if index is None:
+            return
+        measured = index in self.annotations.lines()[:2]
+        self.annotations.remove(index)
+        self.update_contrast_table()
+        if measured:
+            self.calculate_rgb_and_contrast()
+
+    def enable_reference_box(self):
+        """Enable reference box mode: each dragged box becomes a background every line is compared with."""
+        self.drawing_enabled = False
+        self.predict_mode = False
+        self.canvas.bind("<ButtonPress-1>", self.start_reference_box)
+        self.canvas.bind("<B1-Motion>", self.draw_reference_box)
+        self.canvas.bind("<ButtonRelease-1>", self.end_reference_box)
+
+    def start_reference_box(self, event):
+        """Start drawing a reference background box."""
+        self.start_box(event, "purple")
+
+    def draw_reference_box(self, event):
+        """Update the reference box as the mouse moves."""
+        self.frames.schedule("box", lambda: self.stretch_box(event.x, event.y))
+
+    def end_reference_box(self, event):
+        """Store the dragged box as a reference background."""
+        self.frames.flush()
+        if not self.box_coords or self.pixels is None:
+            return
+        x0, y0 = self.box_coords[0]
+        box = self.canvas_box_to_image(x0, y0, event.x, event.y)
+        self.canvas.delete("box")
+        self.box_coords = []
+        if (box[2] - box[0]) * (box[3] - box[1]) == 0:
+            return
+        index = self.annotations.add_box(box, "purple")
+        self.annotations.set_text(index, f"box {self.annotations.number[index]}")
+        self.redraw_annotations(moved=False)
+        self.update_contrast_table()
+
+    def sampling(self):
+        """(line width, bilinear) for line sampling from the controls."""
+        try:
+            width = max(1, self.line_width.get())
+        except tk.TclError:  # Non-numeric entry in the spinbox
+            width = 1
+        return width, self.subpixel_enabled.get()
+
+    def show_contrast_table(self):
+        """Open a window listing the contrast of every line pair and line-vs-box pair."""
+        if self.contrast_window is not None and self.contrast_window.winfo_exists():
+            self.contrast_window.lift()
+            return
+        self.contrast_window = tk.Toplevel(self.root)
+        self.contrast_window.title("Contrast Table")
+        self.contrast_text = tk.Text(self.contrast_window, font=("Courier", 10), width=100, height=24, wrap=tk.NONE)
+        scrollbar = tk.Scrollbar(self.contrast_window, command=self.contrast_text.yview)
+        self.contrast_text.config(yscrollcommand=scrollbar.set)
+        buttons = tk.Frame(self.contrast_window)
+        buttons.pack(side=tk.BOTTOM, fill=tk.X)
+        tk.Button(buttons, text="Export CSV", command=self.export_contrast_table).pack(side=tk.LEFT)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.contrast_text.pack(fill=tk.BOTH, expand=True)
+        self.update_contrast_table()
+
+    def update_contrast_table(self):
+        """Measure lines and boxes that changed and refresh the table window, if it is open."""
+        if self.contrast_window is None or not self.contrast_window.winfo_exists():
+            self.contrast_window = None
+            return
+        with span("contrast table", "gui"):
+            self.contrast_table.sync(*self.sampling())
+        lines = [f"{'pair':>4s} {'sample':>8s} {'background':>10s} {'sample RGB':>20s} {'background RGB':>20s} {'contrast':>24s}"]
+        for row, (sample, background), sample_rgb, background_rgb, contrast in zip(
+                range(1, len(self.contrast_table.rows) + 1), self.contrast_table.rows, self.contrast_table.sample_rgb,
+                self.contrast_table.background_rgb, self.contrast_table.contrast):
+            lines.append(f"{row:4d} {sample:>8s} {background:>10s} {np.array2string(sample_rgb, precision=1):>20s} "
+                         f"{np.array2string(background_rgb, precision=1):>20s} {np.array2string(contrast, precision=3):>24s}")
+        if len(lines) == 1:
+            lines.append("Draw lines in pairs (background, then sample) or add a reference box.")
+        self.contrast_text.config(state=tk.NORMAL)
+        self.contrast_text.delete("1.0", tk.END)
+        self.contrast_text.insert("1.0", "\n".join(lines))
+        self.contrast_text.config(state=tk.DISABLED)
+
+    def export_contrast_table(self):
+        """Save the contrast table as CSV."""
+        path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV", "*.csv")])
+        if path:
+            self.contrast_table.sync(*self.sampling())
+            rows = self.contrast_table.write_csv(path)
+            messagebox.showinfo("Info", f"Wrote {rows} rows to {path}")
+
     def clear_drawings(self):
         """Clear all drawings from the canvas."""
-        for line_id in self.lines:
-            self.canvas.delete(line_id)  # Delete each line from the canvas
-        for label_id in self.line_labels:
-            self.canvas.delete(label_id)  # Delete each label from the canvas
-        for prediction_id in self.predictions:
-            self.canvas.delete(prediction_id)  # Delete each prediction from the canvas
-        self.lines = []  # Clear the lines list
-        self.line_labels = []  # Clear the labels list
-        self.line_coords = []  # Clear the line coordinates list
-        self.original_line_coords = []  # Clear the original line coordinates list
-        self.predictions = []  # Clear the predictions list
+        self.annotations.clear()  # Delete every line, label and prediction
+        self.contrast_table.invalidate()  # Annotation indices start again from zero
+        self.update_contrast_table()
         self.rgb_values.set("Average RGB Values and Contrast:")  # Reset the RGB values text
         self.r_value.set("")  # Clear R value
         self.g_value.set("")  # Clear G value
@@ -182,15 +467,18 @@ class ImageApp:
 
     def calculate_rgb_and_contrast(self):
         """Calculate and display the average RGB values and contrast for the drawn lines."""
-        img_array = np.array(self.image)  # Convert image to numpy array
-        if len(self.line_coords) < 2:
+        img_array = self.pixels.array  # Cached native-resolution pixels, no copy
+        lines = self.annotations.lines()
+        if len(lines) < 2:
+            self.rgb_values.set("Average RGB Values and Contrast:")
             return  # Return if less than two lines are drawn
         
-        line1_rgb = self.get_line_rgb(self.line_coords[0], img_array)  # Get RGB values for the first line
-        line2_rgb = self.get_line_rgb(self.line_coords[1], img_array)  # Get RGB values for the second line
+        line1_rgb = self.get_line_rgb(self.annotations.line(lines[0]), img_array)  # Get RGB values for the first line
+        line2_rgb = self.get_line_rgb(self.annotations.line(lines[1]), img_array)  # Get RGB values for the second line
         
         # Calculate contrast between the two lines for each RGB channel
-        contrast = [abs(line2_rgb[i] - line1_rgb[i]) / line1_rgb[i] for i in range(3)]
+        with span("contrast", "gui"):
+            contrast = engine.line_contrast(line1_rgb, line2_rgb)
         # Set the result text
         result_text = (f"Average RGB Line 1 (background): {line1_rgb}\n"
                        f"Average RGB Line 2 (sample): {line2_rgb}\n"
@@ -202,14 +490,36 @@ class ImageApp:
         self.g_value.set(f"G values: Line 1 - {line1_rgb[1]}, Line 2 - {line2_rgb[1]}, Contrast - {contrast[1]:.2f}")
         self.b_value.set(f"B values: Line 1 - {line1_rgb[2]}, Line 2 - {line2_rgb[2]}, Contrast - {contrast[2]:.2f}")
 
+    def get_line_profile(self, line_coords, img_array):
+        """Get the RGB profile along a line and its average."""
+        width, bilinear = self.sampling()
+        # Exact pixel traversal (or bilinear samples one pixel apart), averaged across the strip width
+        with span("line sampling", "gui", width=width):
+            profile = line_profile(img_array, line_coords[0], line_coords[1], width=width, bilinear=bilinear)
+        return profile, np.mean(profile, axis=0)
+
     def get_line_rgb(self, line_coords, img_array):
         """Get the average RGB values along a line."""
-        # Generate x and y values along the line
-        x_values = np.linspace(line_coords[0][0], line_coords[1][0], num=1000).astype(int)
-        y_values = np.linspace(line_coords[0][1], line_coords[1][1], num=1000).astype(int)
-        rgb_values = img_array[y_values, x_values]  # Get RGB values from the image array
-        avg_rgb = np.mean(rgb_values, axis=0).astype(int)  # Calculate the average RGB values
-        return avg_rgb  # Return the average RGB values
+        profile, avg_rgb = self.get_line_profile(line_coords, img_array)
+        return avg_rgb.astype(int)  # Return the average RGB values
+
+    def redraw_image(self, fast=False):
+        """Render the visible part of the image and the segmentation overlay."""
+        self.renderer.render(self.current_scale, self.view_offset, fast=fast)
+        self.image_id = self.renderer.image_id
+        if self.overlay is not None and self.overlay_enabled.get():
+            # Overlay pixels cover superpixel x superpixel image pixels
+            self.overlay_renderer.render(self.current_scale * self.overlay[1], self.view_offset, fast=fast)
+        else:
+            self.overlay_renderer.clear()
+
+    def image_to_canvas(self, x, y):
+        """Convert image pixel coordinates to canvas coordinates."""
+        return (x * self.current_scale + self.view_offset[0], y * self.current_scale + self.view_offset[1])
+
+    def canvas_to_image(self, x, y):
+        """Convert canvas coordinates to image pixel coordinates."""
+        return ((x - self.view_offset[0]) / self.current_scale, (y - self.view_offset[1]) / self.current_scale)
 
     def start_move(self, event):
         """Start moving the image when the right mouse button is pressed."""
@@ -219,53 +529,40 @@ class ImageApp:
     def move_image(self, event):
         """Move the image on the canvas."""
         if self.movement_enabled.get():
-            dx = event.x - self.start_x
-            dy = event.y - self.start_y
-            self.canvas.move(self.image_id, dx, dy)
-            for line_id in self.lines:
-                self.canvas.move(line_id, dx, dy)
-            for label_id in self.line_labels:
-                self.canvas.move(label_id, dx, dy)
-            for prediction_id in self.predictions:
-                self.canvas.move(prediction_id, dx, dy)
+            # Accumulate the drag and apply it once per frame
+            self.pending_pan = (self.pending_pan[0] + event.x - self.start_x, self.pending_pan[1] + event.y - self.start_y)
             self.start_x = event.x
             self.start_y = event.y
+            self.frames.schedule("pan", self.apply_pan)
+
+    def apply_pan(self):
+        """Shift the view by the accumulated drag distance."""
+        dx, dy = self.pending_pan
+        self.pending_pan = (0, 0)
+        self.view_offset = (self.view_offset[0] + dx, self.view_offset[1] + dy)
+        self.canvas.move("annotation", dx, dy)  # One tag-based move for the drawn lines, labels and predictions
+        self.redraw_image(fast=True)  # Fill in newly exposed areas
+        self.redraw_annotations(moved=False)  # Draw annotations scrolling into view, drop those leaving it
 
     def zoom_image(self, event):
         """Zoom the image in or out with the mouse wheel."""
-        if self.movement_enabled.get():
+        if self.movement_enabled.get() and self.image is not None:
+            self.frames.flush()  # Land any pending pan before rescaling about the cursor
+            factor = 1.0
             if event.delta > 0:  # Zoom in
-                self.current_scale *= 1.1
+                factor = 1.1
             elif event.delta < 0:  # Zoom out
-                self.current_scale /= 1.1
-
-            # Resize the image
-            new_size = (int(self.image.width * self.current_scale), int(self.image.height * self.current_scale))
-            resized_image = self.image.resize(new_size, Image.Resampling.LANCZOS)
-            self.photo = ImageTk.PhotoImage(resized_image)
-
-            # Redraw the image on the canvas
-            if self.image_id:
-                self.canvas.delete(self.image_id)
-            self.image_id = self.canvas.create_image(0, 0, image=self.photo, anchor=tk.NW, tags="image")
-            self.canvas.config(scrollregion=self.canvas.bbox(tk.ALL))
-
-            # Move and scale lines and labels
-            for i, (start, end) in enumerate(self.original_line_coords):
-                if self.lines[i] is not None:
-                    scaled_start = (start[0] * self.current_scale, start[1] * self.current_scale)
-                    scaled_end = (end[0] * self.current_scale, end[1] * self.current_scale)
-                    self.canvas.coords(self.lines[i], scaled_start[0], scaled_start[1], scaled_end[0], scaled_end[1])
-                    line_length = np.sqrt((end[0] - start[0]) ** 2 + (end[1] - start[1]) ** 2)
-                    micrometer_length = line_length / self.pixel_to_micrometer_ratio
-                    self.canvas.coords(self.line_labels[i],
-                                    (scaled_start[0] + scaled_end[0]) // 2,
-                                    (scaled_start[1] + scaled_end[1]) // 2)
-                    self.canvas.itemconfig(self.line_labels[i], text=f"{i + 1}: {micrometer_length:.2f} {'μm' if self.pixel_to_micrometer_ratio != 1 else 'px'}")
-            # Move predictions
-            for pred in self.predictions:
-                coords = self.canvas.coords(pred)
-                self.canvas.coords(pred, coords[0] * self.current_scale, coords[1] * self.current_scale)
+                factor = 1 / 1.1
+            self.current_scale *= factor
+            # Keep the image point under the cursor in place
+            self.view_offset = (event.x - (event.x - self.view_offset[0]) * factor,
+                                event.y - (event.y - self.view_offset[1]) * factor)
+
+            # Resample only the visible region, fast now and LANCZOS once the wheel settles
+            self.redraw_image(fast=True)
+
+            # Place lines, labels and predictions; only those in view have canvas items
+            self.redraw_annotations()
 
             # Bring lines, labels, and predictions to the front
             self.canvas.tag_raise("line")
@@ -284,23 +581,38 @@ class ImageApp:
             self.pixel_to_micrometer_ratio = 1.0
         
         # Update the lengths of existing lines
-        for i, (start, end) in enumerate(self.original_line_coords):
-            line_length = np.sqrt((end[0] - start[0]) ** 2 + (end[1] - start[1]) ** 2)
-            micrometer_length = line_length / self.pixel_to_micrometer_ratio
-            self.canvas.itemconfig(self.line_labels[i], text=f"{i + 1}: {micrometer_length:.2f} {'μm' if self.pixel_to_micrometer_ratio != 1 else 'px'}")
+        for index in self.annotations.lines():
+            self.annotations.set_text(index, self.line_label(index))
 
     def load_model(self):
         """Load a pre-trained SVM model."""
-        model_path = filedialog.askopenfilename(filetypes=[("Pickle files", "*.pkl")])
+        model_path = filedialog.askopenfilename(filetypes=[("Model artifact", "model.json"), ("Model files", "*.pkl *.m"), ("Lookup cube", "*.npz")])
         if model_path:
-            with open(model_path, "rb") as f:
-                self.model = pickle.load(f)
+            # Unpickling can take a while, so it runs on a worker thread
+            self.tasks.submit("load model", self.read_model, model_path, on_done=self.set_model,
+                              on_error=lambda exc: messagebox.showerror("Error", f"Could not load model: {exc}"))
+
+    def read_model(self, model_path):
+        """Read a model file (runs on a worker thread)."""
+        with span("model load", "gui", path=model_path):
+            return engine.load_model(model_path)
+
+    def set_model(self, model):
+        """Use a newly loaded model."""
+        self.model = model
+        self.segment_cache.clear()
+        self.set_overlay(None)
+        if self.background_map is not None:  # Automatic background still applies to the new model
+            messagebox.showinfo("Success", "SVM model loaded successfully.")
+        else:
             self.background_rgb = None
             messagebox.showinfo("Success", "SVM model loaded successfully. Please set the background again.")
     
     def set_background(self):
         """Enable background selection mode."""
         self.background_rgb = None
+        self.background_map = None
+        self.auto_background.set(False)
         self.drawing_enabled = False
         self.predict_mode = False
         self.canvas.bind("<ButtonPress-1>", self.start_box_background)
@@ -309,27 +621,80 @@ class ImageApp:
 
     def start_box_background(self, event):
         """Start drawing a box to set background RGB values."""
-        self.box_coords = [(event.x, event.y)]
+        self.start_box(event, "green")
 
     def draw_box_background(self, event):
         """Update the box for background selection as the mouse moves."""
-        x0, y0 = self.box_coords[0]
-        x1, y1 = event.x, event.y
-        self.canvas.delete("box")
-        self.canvas.create_rectangle(x0, y0, x1, y1, outline="green", tag="box")
+        self.frames.schedule("box", lambda: self.stretch_box(event.x, event.y))
 
     def end_box_background(self, event):
         """Finish drawing the box and set the background RGB values."""
+        self.frames.flush()
         x0, y0 = self.box_coords[0]
         x1, y1 = event.x, event.y
-        box = (min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1))
-        cropped_image = self.image.crop(box)
-        img_array = np.array(cropped_image)
-        self.background_rgb = np.mean(img_array, axis=(0, 1))
+        box = self.canvas_box_to_image(x0, y0, x1, y1)
+        self.background_rgb = self.pixels.box_mean(box)  # From the tile summed-area table
         self.canvas.delete("box")
         self.box_coords = []
         messagebox.showinfo("Info", "Background set successfully.")
     
+    def apply_auto_background(self):
+        """Use the automatic background estimate of the loaded image."""
+        if self.auto_estimate is None:
+            return
+        self.background_rgb, self.background_map = self.auto_estimate
+        self.rgb_values.set(f"Background (auto): {np.round(self.background_rgb, 1)}")
+
+    def toggle_auto_background(self):
+        """Switch between the automatic estimate and a manually selected background."""
+        if self.auto_background.get():
+            self.apply_auto_background()
+        elif self.background_map is not None:
+            self.background_rgb = self.background_map = None
+
+    def background_for(self, box):
+        """Background RGB to compare the image box against, vignetting-corrected if enabled."""
+        if self.vignetting_enabled.get() and self.background_map is not None:
+            return self.background_map.box(box)
+        return self.background_rgb
+
+    def start_box(self, event, outline):
+        """Start a rubber-band box at the cursor."""
+        self.box_coords = [(event.x, event.y)]
+        self.canvas.delete("box")
+        self.canvas.create_rectangle(event.x, event.y, event.x, event.y, outline=outline, tag="box")
+
+    def stretch_box(self, x1, y1):
+        """Reshape the rubber-band box in place and update the live readout."""
+        if not self.box_coords:
+            return
+        x0, y0 = self.box_coords[0]
+        self.canvas.coords("box", x0, y0, x1, y1)
+        self.show_box_readout(self.canvas_box_to_image(x0, y0, x1, y1))
+
+    def canvas_box_to_image(self, x0, y0, x1, y1):
+        """Convert a dragged canvas box to an integer image-pixel box (left, top, right, bottom).
+
+        Both edges round the same way (pixel_box), so the box holds the
+        pixels whose centres fall inside the dragged area.
+        """
+        left, top = self.canvas_to_image(min(x0, x1), min(y0, y1))
+        right, bottom = self.canvas_to_image(max(x0, x1), max(y0, y1))
+        return pixel_box(left, top, right, bottom, self.pixels.shape)
+
+    def show_box_readout(self, box):
+        """Show the live mean RGB, spread and contrast of the box being dragged."""
+        if (box[2] - box[0]) * (box[3] - box[1]) == 0:
+            return
+        with span("box readout", "gui"):
+            mean_rgb, var_rgb = self.pixels.box_stats(box)
+        result_text = (f"Box mean RGB: {np.round(mean_rgb, 1)}\n"
+                       f"Box std RGB: {np.round(np.sqrt(var_rgb), 1)}")
+        if self.background_rgb is not None:
+            contrast_rgb = engine.contrast(mean_rgb, self.background_for(box))
+            result_text += f"\nContrast: {np.round(contrast_rgb, 3)}"
+        self.rgb_values.set(result_text)
+
     def enable_prediction(self):
         """Enable prediction mode."""
         if self.background_rgb is None:
@@ -343,34 +708,139 @@ class ImageApp:
 
     def start_box_prediction(self, event):
         """Start drawing a box to predict thickness."""
-        self.box_coords = [(event.x, event.y)]
+        self.start_box(event, "blue")
 
     def draw_box_prediction(self, event):
         """Update the box for prediction as the mouse moves."""
-        x0, y0 = self.box_coords[0]
-        x1, y1 = event.x, event.y
-        self.canvas.delete("box")
-        self.canvas.create_rectangle(x0, y0, x1, y1, outline="blue", tag="box")
+        self.frames.schedule("box", lambda: self.stretch_box(event.x, event.y))
 
     def end_box_prediction(self, event):
         """Finish drawing the box and predict the thickness."""
+        self.frames.flush()
         if self.model is None:
             messagebox.showerror("Error", "No model loaded for prediction.")
             return
         x0, y0 = self.box_coords[0]
         x1, y1 = event.x, event.y
-        box = (min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1))
-        cropped_image = self.image.crop(box)
-        img_array = np.array(cropped_image)
-        avg_rgb = np.mean(img_array, axis=(0, 1))
-        contrast_rgb = (avg_rgb - self.background_rgb) / self.background_rgb
-        prediction = self.model.predict([contrast_rgb])[0]
-        prediction_id = self.canvas.create_text((x0 + x1) // 2, (y0 + y1) // 2, text=str(prediction), fill="blue", tags="prediction")
-        self.predictions.append(prediction_id)
+        box = self.canvas_box_to_image(x0, y0, x1, y1)
         self.canvas.delete("box")
         self.box_coords = []
+        if box[2] <= box[0] or box[3] <= box[1]:  # A click without a drag covers no pixel centre
+            messagebox.showwarning("Warning", "Drag a box at least one pixel wide and high to predict.")
+            return
+        avg_rgb = self.pixels.box_mean(box)  # From the tile summed-area table
+        contrast_rgb = engine.contrast(avg_rgb, self.background_for(box))
+        center = self.canvas_to_image((x0 + x1) // 2, (y0 + y1) // 2)
+        # Each box gets its own job name so quick successive boxes do not cancel each other
+        self.prediction_count += 1
+        self.tasks.submit(f"predict {self.prediction_count}", self.predict_contrast, contrast_rgb,
+                          on_done=lambda prediction: self.show_prediction(prediction, center),
+                          on_error=lambda exc: messagebox.showerror("Error", f"Prediction failed: {exc}"))
+
+    def predict_contrast(self, contrast_rgb):
+        """Model prediction for one contrast triple (runs on a worker thread)."""
+        with span("model.predict", "gui"):
+            return self.model.predict([contrast_rgb])[0]
+
+    def show_prediction(self, prediction, center):
+        """Place a prediction label at the given image coordinates."""
+        self.annotations.add_prediction(center, str(prediction))
+        self.redraw_annotations(moved=False)
+
+    def segment_key(self):
+        """Cache key for the current image, model and background."""
+        return (id(self.image), id(self.model), tuple(np.round(self.background_rgb, 6)), self.segment_superpixel,
+                self.vignetting_enabled.get() and self.background_map is not None)
+
+    def segment_image(self):
+        """Classify the whole image on a background thread and overlay the label map."""
+        if self.image is None or self.model is None:
+            messagebox.showerror("Error", "Load an image and a model first.")
+            return
+        if self.background_rgb is None:
+            messagebox.showwarning("Warning", "Please set the background first.")
+            return
+        key = self.segment_key()
+        if key in self.segment_cache:
+            self.set_overlay(self.segment_cache[key])
+            return
+        superpixel = self.segment_superpixel
+        background_map = self.background_map if self.vignetting_enabled.get() else None
+        self.tasks.submit("segment", self.compute_overlay, self.pixels.array, self.background_rgb, background_map, self.model, superpixel,
+                          pass_task=True, on_done=lambda overlay: self.finish_segmentation(key, overlay),
+                          on_error=lambda exc: messagebox.showerror("Error", f"Segmentation failed: {exc}"))
+
+    def compute_overlay(self, img_array, background_rgb, background_map, model, superpixel, task):
+        """Label the whole image and build its overlay (runs on a worker thread)."""
+        with span("segment image", "gui", superpixel=superpixel):
+            labels = segment_image(img_array, background_rgb, model, superpixel, cancel=task.cancel_event, progress=task.set_progress,
+                                   background_map=background_map)
+        return None if labels is None else (label_overlay(labels, PALETTE), superpixel)
+
+    def finish_segmentation(self, key, overlay):
+        """Cache a finished segmentation and show it if the state has not changed meanwhile."""
+        if overlay is None:
+            return
+        self.segment_cache[key] = overlay
+        if key == self.segment_key():
+            self.set_overlay(overlay)
+
+    def toggle_timing(self):
+        """Start or stop recording timing spans."""
+        if self.timing_enabled.get():
+            svm_trace.enable()
+        else:
+            svm_trace.disable()
+
+    def show_timing_panel(self):
+        """Open a window with live per-span timing totals."""
+        if self.timing_window is not None and self.timing_window.winfo_exists():
+            self.timing_window.lift()
+            return
+        self.timing_window = tk.Toplevel(self.root)
+        self.timing_window.title("Timing")
+        self.timing_text = tk.StringVar()
+        tk.Label(self.timing_window, textvariable=self.timing_text, font=("Courier", 10), justify=tk.LEFT, anchor="nw").pack(fill=tk.BOTH, expand=True)
+        buttons = tk.Frame(self.timing_window)
+        buttons.pack(fill=tk.X)
+        tk.Button(buttons, text="Save Trace", command=self.save_trace).pack(side=tk.LEFT)
+        tk.Button(buttons, text="Clear", command=svm_trace.tracer.clear).pack(side=tk.LEFT)
+        self.refresh_timing_panel()
+
+    def refresh_timing_panel(self):
+        """Redraw the timing table twice a second while the panel is open."""
+        if self.timing_window is None or not self.timing_window.winfo_exists():
+            self.timing_window = None
+            return
+        lines = [f"{'span':24s} {'count':>6s} {'total ms':>10s} {'mean ms':>9s} {'max ms':>9s} {'last ms':>9s}"]
+        for name, count, total, mean, longest, last in svm_trace.summary():
+            lines.append(f"{name[:24]:24s} {count:6d} {total:10.1f} {mean:9.2f} {longest:9.2f} {last:9.2f}")
+        if not self.timing_enabled.get():
+            lines.append("(recording is off)")
+        self.timing_text.set("\n".join(lines))
+        self.root.after(500, self.refresh_timing_panel)
+
+    def save_trace(self):
+        """Write the recorded spans as a Chrome trace (chrome://tracing, Perfetto, speedscope)."""
+        path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("Chrome trace", "*.json")])
+        if path:
+            svm_trace.dump(path)
+
+    def set_overlay(self, overlay):
+        """Show a (label image, superpixel) overlay, or remove it with None."""
+        self.overlay = overlay
+        self.overlay_renderer.set_source(None if overlay is None else overlay[0])
+        if overlay is None:
+            self.overlay_renderer.clear()
+        else:
+            self.redraw_image()
+
+    def toggle_overlay(self):
+        """Show or hide the segmentation overlay without recomputing it."""
+        if self.overlay is not None:
+            self.redraw_image()
 
 if __name__ == "__main__":
     root = tk.Tk()  # Create the main window
     app = ImageApp(root)  # Create an instance of the ImageApp class
-    root.mainloop()  # Run the main event loop
+    run_app(root, ["numpy", "PIL.Image", "PIL.ImageTk"])  # Run the main event loop, finishing imports once the window is up
@@ -0,0 +1,34 @@
+# -*- mode: python ; coding: utf-8 -*-
+# PyInstaller build for neo_gui.py, tuned for start-up time.
+#
+#   pyinstaller neo_gui.spec                             # one-dir: dist/neo_gui/neo_gui.exe, fastest start
+#   set BUNDLE_MODE=onefile && pyinstaller neo_gui.spec  # single dist/neo_gui.exe, unpacks on every start
+#
+# numpy and PIL are imported through startup.lazy_import, which PyInstaller cannot
+# see, so they are listed as hidden imports. The excludes drop modules the old
+# build dragged in without using them; fewer modules is a smaller archive to open
+# and, for one-file builds, less to unpack before the window can appear.
+# Time a build with: python startup.py dist/neo_gui/neo_gui.exe --runs 5
+import os
+
+MODE = os.environ.get("BUNDLE_MODE", "onedir").strip()
+
+EXCLUDES = [
+    "xml", "xmlrpc", "http", "pydoc_data", "doctest", "pdb", "sqlite3", "tarfile", "ftplib", "webbrowser",
+    "numpy.distutils", "PIL.ImageQt", "PyQt5", "PyQt6", "PySide2", "PySide6", "matplotlib", "IPython", "pandas",
+]
+
+a = Analysis(
+    ["neo_gui.py"],
+    pathex=[SPECPATH, os.path.join(SPECPATH, "SVM")],
+    hiddenimports=["numpy", "PIL.Image", "PIL.ImageTk", "sklearn.svm"],  # Pickled SVC models need sklearn.svm
+    excludes=EXCLUDES,
+    noarchive=False,
+)
+pyz = PYZ(a.pure)
+
+if MODE == "onefile":
+    exe = EXE(pyz, a.scripts, a.binaries, a.datas, [], name="neo_gui", console=False, upx=False)
+else:
+    exe = EXE(pyz, a.scripts, [], exclude_binaries=True, name="neo_gui", console=False, upx=False)
+    coll = COLLECT(exe, a.binaries, a.datas, name="neo_gui", upx=False)
@@ -0,0 +1,101 @@
+import hashlib
+import math
+import os
+import threading
+from collections import OrderedDict
+
+from startup import lazy_import
+
+np = lazy_import("numpy")
+Image = lazy_import("PIL.Image")
+
+
+class ImagePyramid:
+    """Native-resolution RGB image with lazily built 2x-reduced levels, served as tiles.
+
+    Level 0 is the full-resolution array; level k is reduced by 2**k. Levels
+    are only built when a zoom level needs them, and with cache_dir they are
+    written there as .npy files and memory-mapped on later loads of the same
+    image. Tiles are kept in a small LRU cache.
+    """
+
+    def __init__(self, array, tile_size=512, cache_dir=None, cache_key=None, max_tiles=64):
+        self.levels = {0: array}
+        self.tile_size = tile_size
+        self.cache_dir = cache_dir
+        self.cache_key = cache_key
+        self.max_tiles = max_tiles
+        self.tiles = OrderedDict()
+        self.lock = threading.RLock()  # Tiles are requested from the Tk thread and from render workers
+        self.height, self.width = array.shape[:2]
+        # Stop once the whole image fits into a single tile
+        self.max_level = max(0, math.ceil(math.log2(max(self.width, self.height) / tile_size)))
+
+    @classmethod
+    def open(cls, file_path, cache_dir=None, **kwargs):
+        """Decode an image file into a pyramid, keyed for the disk cache by path, size and mtime."""
+        stat = os.stat(file_path)
+        key = hashlib.sha1(f"{os.path.abspath(file_path)}:{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest()
+        with Image.open(file_path) as image:
+            array = np.asarray(image.convert('RGB'))
+        return cls(array, cache_dir=cache_dir, cache_key=key, **kwargs)
+
+    @property
+    def base(self):
+        return self.levels[0]
+
+    def level(self, k):
+        """Array of level k, building (and caching) it from level k - 1 if needed."""
+        k = min(k, self.max_level)
+        if k not in self.levels:
+            path = None
+            if self.cache_dir and self.cache_key:
+                path = os.path.join(self.cache_dir, f"{self.cache_key}_L{k}.npy")
+            if path and os.path.exists(path):
+                self.levels[k] = np.load(path, mmap_mode='r')
+            else:
+                reduced = np.asarray(Image.fromarray(np.ascontiguousarray(self.level(k - 1))).reduce(2))
+                if path:
+                    os.makedirs(self.cache_dir, exist_ok=True)
+                    np.save(path, reduced)
+                self.levels[k] = reduced
+        return self.levels[k]
+
+    def level_for_scale(self, scale):
+        """Coarsest level that still has at least one pixel per screen pixel at this scale."""
+        if scale >= 1:
+            return 0
+        return min(self.max_level, int(math.floor(math.log2(1 / scale))))
+
+    def tile(self, k, tx, ty):
+        with self.lock:
+            return self._tile(k, tx, ty)
+
+    def _tile(self, k, tx, ty):
+        key = (k, tx, ty)
+        tile = self.tiles.get(key)
+        if tile is None:
+            t = self.tile_size
+            tile = Image.fromarray(np.ascontiguousarray(self.level(k)[ty * t:(ty + 1) * t, tx * t:(tx + 1) * t]))
+            self.tiles[key] = tile
+            while len(self.tiles) > self.max_tiles:
+                self.tiles.popitem(last=False)
+        else:
+            self.tiles.move_to_end(key)
+        return tile
+
+    def region(self, box, size, resample):
+        """Render the native-pixel box (x0, y0, x1, y1) to an image of the given size from the matching level's tiles."""
+        k = self.level_for_scale(size[0] / max(1e-9, box[2] - box[0]))
+        with self.lock:
+            level = self.level(k)
+        sx, sy = level.shape[1] / self.width, level.shape[0] / self.height
+        lbox = (box[0] * sx, box[1] * sy, box[2] * sx, box[3] * sy)
+        ix0, iy0 = int(lbox[0]), int(lbox[1])
+        ix1, iy1 = min(level.shape[1], math.ceil(lbox[2])), min(level.shape[0], math.ceil(lbox[3]))
+        t = self.tile_size
+        mosaic = Image.new('RGB', (max(1, ix1 - ix0), max(1, iy1 - iy0)))
+        for ty in range(iy0 // t, (iy1 - 1) // t + 1):
+            for tx in range(ix0 // t, (ix1 - 1) // t + 1):
+                mosaic.paste(self.tile(k, tx, ty), (tx * t - ix0, ty * t - iy0))
+        return mosaic.resize(size, resample, box=(lbox[0] - ix0, lbox[1] - iy0, lbox[2] - ix0, lbox[3] - iy0))
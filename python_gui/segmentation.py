@@ -0,0 +1,58 @@
+from startup import lazy_import
+
+np = lazy_import("numpy")
+Image = lazy_import("PIL.Image")
+
+
+def superpixel_contrast(img_array, background_rgb, superpixel, r0, r1):
+    """Contrast (mean - background) / background of superpixel rows r0..r1, shape (r1 - r0, W // superpixel, C)."""
+    s = superpixel
+    width = img_array.shape[1] // s
+    block = img_array[r0 * s:r1 * s, :width * s].reshape(r1 - r0, s, width, s, -1)
+    mean_rgb = block.mean(axis=(1, 3))
+    return (mean_rgb - background_rgb) / background_rgb
+
+
+def segment_image(img_array, background_rgb, model, superpixel=4, block_rows=64, cancel=None, progress=None, background_map=None):
+    """Classify the whole image on a grid of superpixel x superpixel blocks.
+
+    Blocks are averaged and predicted block_rows grid rows at a time, so each
+    model.predict call is a large vectorized batch and memory stays bounded.
+    Returns the (H // superpixel, W // superpixel) label map, or None if the
+    cancel event is set before it finishes. progress, if given, is called
+    with the finished fraction after every batch. With a background_map
+    (background.BackgroundMap) each block is compared against the local
+    background instead of the single background_rgb.
+    """
+    background_rgb = np.asarray(background_rgb, dtype=np.float64)
+    height, width = img_array.shape[0] // superpixel, img_array.shape[1] // superpixel
+    labels = None
+    for r0 in range(0, height, block_rows):
+        if cancel is not None and cancel.is_set():
+            return None
+        r1 = min(height, r0 + block_rows)
+        background = background_rgb if background_map is None else background_map.superpixel_rows(superpixel, r0, r1, width)
+        contrast = superpixel_contrast(img_array, background, superpixel, r0, r1)
+        prediction = np.asarray(model.predict(contrast.reshape(-1, contrast.shape[-1])))
+        if labels is None:
+            labels = np.empty((height, width), dtype=prediction.dtype)
+        labels[r0:r1] = prediction.reshape(r1 - r0, width)
+        if progress is not None:
+            progress(r1 / height)
+    if labels is None:
+        labels = np.empty((height, width))
+    return labels
+
+
+def label_overlay(labels, palette, alpha=110):
+    """RGBA overlay image of a label map; label 0 (background) is transparent, unknown labels are grey."""
+    colors = np.zeros((len(palette), 4), dtype=np.uint8)
+    colors[:, :3] = palette
+    colors[:, 3] = alpha
+    colors[0, 3] = 0
+    index = np.rint(np.asarray(labels, dtype=np.float64)).astype(np.intp)
+    valid = (index >= 0) & (index < len(palette))
+    overlay = np.empty(labels.shape + (4,), dtype=np.uint8)
+    overlay[...] = (128, 128, 128, alpha)
+    overlay[valid] = colors[index[valid]]
+    return Image.fromarray(overlay, 'RGBA')
@@ -0,0 +1,112 @@
+import queue
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Task:
+    """Handle for a submitted job; the job polls cancelled and may report progress."""
+
+    def __init__(self, name):
+        self.name = name
+        self.cancel_event = threading.Event()
+        self.progress = None
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def set_progress(self, fraction):
+        self.progress = fraction
+
+
+class TaskExecutor:
+    """Run heavy work off the Tk thread and hand results back through root.after.
+
+    Jobs run on a small thread pool. Submitting a job under a name that is
+    still running cancels the older one, and its result is dropped, so a
+    zoom or load superseded by newer input never reaches the UI. status, if
+    given, is a StringVar showing running jobs and their progress.
+    """
+
+    def __init__(self, root, max_workers=4, poll_ms=30, status=None):
+        self.root = root
+        self.pool = ThreadPoolExecutor(max_workers=max_workers)
+        self.poll_ms = poll_ms
+        self.status = status
+        self.results = queue.Queue()
+        self.running = {}
+        self.polling = False
+
+    def submit(self, name, fn, *args, on_done=None, on_error=None, pass_task=False, **kwargs):
+        """Run fn(*args, **kwargs) (plus task=Task if pass_task) and call on_done(result) on the Tk thread."""
+        previous = self.running.get(name)
+        if previous is not None:
+            previous.cancel()
+        task = Task(name)
+        self.running[name] = task
+        if pass_task:
+            kwargs["task"] = task
+
+        def run():
+            try:
+                self.results.put((task, True, fn(*args, **kwargs), on_done, on_error))
+            except Exception as exc:
+                self.results.put((task, False, exc, on_done, on_error))
+
+        self.pool.submit(run)
+        self._start_polling()
+        return task
+
+    def cancel(self, name):
+        task = self.running.pop(name, None)
+        if task is not None:
+            task.cancel()
+
+    def _start_polling(self):
+        if not self.polling:
+            self.polling = True
+            self.root.after(self.poll_ms, self._poll)
+
+    def _poll(self):
+        while True:
+            try:
+                task, ok, value, on_done, on_error = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if self.running.get(task.name) is task:
+                del self.running[task.name]
+            if task.cancelled:
+                continue
+            if ok and on_done is not None:
+                on_done(value)
+            elif not ok:
+                if on_error is not None:
+                    on_error(value)
+                else:
+                    traceback.print_exception(type(value), value, value.__traceback__)
+        self._show_status()
+        if self.running:
+            self.root.after(self.poll_ms, self._poll)
+        else:
+            self.polling = False
+
+    def _show_status(self):
+        if self.status is None:
+            return
+        parts = []
+        for task in self.running.values():
+            if task.progress is None:
+                parts.append(task.name)
+            else:
+                parts.append(f"{task.name} {task.progress:.0%}")
+        self.status.set(("Working: " + ", ".join(parts)) if parts else "Ready")
+
+    def shutdown(self):
+        """Cancel running jobs and drop queued ones; jobs that poll task.cancelled stop at their next check."""
+        for task in self.running.values():
+            task.cancel()
+        self.pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,164 @@
+import math
+from collections import OrderedDict
+
+import tkinter as tk
+from startup import lazy_import
+
+Image = lazy_import("PIL.Image")
+ImageTk = lazy_import("PIL.ImageTk")
+
+try:
+    from svm_trace import span
+except ImportError:  # Timing spans are optional; neo_gui puts SVM/ on sys.path first
+    from contextlib import nullcontext
+
+    def span(name, cat="", **args):
+        return nullcontext()
+
+
+class ViewportRenderer:
+    """Draw only the visible part of an image on a canvas at a given scale and offset.
+
+    The image point (x, y) is shown at canvas position (offset[0] + x * scale,
+    offset[1] + y * scale). Only the visible region plus a margin is resampled,
+    recently rendered views are kept in an LRU cache, and render(fast=True)
+    uses a cheap filter and schedules a LANCZOS pass once calls stop for
+    settle_ms milliseconds. With a TaskExecutor that pass is resampled off
+    the Tk thread and dropped if a newer render comes in first.
+    photo_factory turns a rendered PIL region into what create_image draws;
+    it defaults to ImageTk.PhotoImage.
+    """
+
+    def __init__(self, canvas, cache_size=8, settle_ms=150, margin=128,
+                 fast_filter="bilinear", final_filter="lanczos",
+                 tag="image", above=None, executor=None, photo_factory=None):
+        self.canvas = canvas
+        self.executor = executor
+        self.photo_factory = photo_factory
+        self.tag = tag
+        self.above = above  # Canvas tag to stack the item above; None puts it at the bottom
+        self.cache_size = cache_size
+        self.settle_ms = settle_ms
+        self.margin = margin
+        self.fast_filter = fast_filter
+        self.final_filter = final_filter
+        self.source = None
+        self.image_id = None
+        self.photo = None
+        self.cache = OrderedDict()
+        self.pending = None
+        self.generation = 0  # Bumped on every render so late background results can be discarded
+
+    def set_source(self, image):
+        """Use a new PIL image or ImagePyramid and forget everything rendered from the old one."""
+        self.source = image
+        self.cache.clear()
+        self.cancel()
+
+    def clear(self):
+        """Remove the image from the canvas."""
+        self.cancel()
+        if self.image_id:
+            self.canvas.delete(self.image_id)
+        self.image_id = None
+        self.photo = None
+
+    def cancel(self):
+        if self.pending is not None:
+            self.canvas.after_cancel(self.pending)
+            self.pending = None
+        if self.executor is not None:
+            self.executor.cancel("render " + self.tag)
+
+    def canvas_size(self):
+        width, height = self.canvas.winfo_width(), self.canvas.winfo_height()
+        if width <= 1 or height <= 1:  # Not mapped yet, use the configured size
+            width, height = int(self.canvas.cget("width")), int(self.canvas.cget("height"))
+        return width, height
+
+    def visible_box(self, scale, offset):
+        """Image-pixel box (x0, y0, x1, y1) covering the canvas plus margin, aligned so nearby views share cache entries."""
+        width, height = self.canvas_size()
+        align = max(1, int(self.margin / scale))
+        x0 = max(0, math.floor((-offset[0] - self.margin) / scale / align) * align)
+        y0 = max(0, math.floor((-offset[1] - self.margin) / scale / align) * align)
+        x1 = min(self.source.width, math.ceil((width - offset[0] + self.margin) / scale / align) * align)
+        y1 = min(self.source.height, math.ceil((height - offset[1] + self.margin) / scale / align) * align)
+        if x1 <= x0 or y1 <= y0:
+            return None
+        return (x0, y0, x1, y1)
+
+    def render(self, scale, offset, fast=False):
+        """Show the image at scale/offset; fast=True defers the high-quality pass."""
+        self.cancel()
+        self.generation += 1
+        if self.source is None:
+            return
+        box = self.visible_box(scale, offset)
+        if box is None:
+            self.clear()
+            return
+        key = (round(scale, 6), box)
+        photo = self.cache.get(key + (self.final_filter,))
+        if photo is None and fast:
+            photo = self._resample(key, self.fast_filter)
+            self.pending = self.canvas.after(self.settle_ms, self._finish, scale, offset)
+        elif photo is None:
+            photo = self._resample(key, self.final_filter)
+        else:
+            self.cache.move_to_end(key + (self.final_filter,))
+        self._show(photo, box[0] * scale + offset[0], box[1] * scale + offset[1])
+
+    def _finish(self, scale, offset):
+        """High-quality pass after the input has settled."""
+        self.pending = None
+        if self.executor is None:
+            self.render(scale, offset)
+            return
+        box = self.visible_box(scale, offset)
+        if box is None:
+            return
+        key = (round(scale, 6), box)
+        generation = self.generation
+        source = self.source
+
+        def done(region):
+            if generation == self.generation and source is self.source:
+                self._show(self._photo(key, self.final_filter, region), box[0] * scale + offset[0], box[1] * scale + offset[1])
+
+        self.executor.submit("render " + self.tag, self._region, source, key, self.final_filter, on_done=done)
+
+    def _region(self, source, key, resample):
+        """Resampled PIL image of the key's box; safe to call off the Tk thread."""
+        scale, box = key
+        fast = resample != self.final_filter
+        if isinstance(resample, str):  # Filter names keep Pillow out of import time
+            resample = Image.Resampling[resample.upper()]
+        size = (max(1, round((box[2] - box[0]) * scale)), max(1, round((box[3] - box[1]) * scale)))
+        with span("resize", "gui", width=size[0], height=size[1], fast=fast):
+            if isinstance(source, Image.Image):
+                return source.resize(size, resample, box=box)
+            return source.region(box, size, resample)  # ImagePyramid tiles at the matching level
+
+    def _resample(self, key, resample):
+        return self._photo(key, resample, self._region(self.source, key, resample))
+
+    def _photo(self, key, resample, region):
+        photo = (self.photo_factory or ImageTk.PhotoImage)(region)
+        if resample == self.final_filter:  # Fast previews are not worth a cache slot
+            self.cache[key + (resample,)] = photo
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return photo
+
+    def _show(self, photo, x, y):
+        self.photo = photo  # Keep a reference so Tk does not drop the bitmap
+        if self.image_id:
+            self.canvas.itemconfig(self.image_id, image=photo)
+            self.canvas.coords(self.image_id, x, y)
+        else:
+            self.image_id = self.canvas.create_image(x, y, image=photo, anchor=tk.NW, tags=self.tag)
+        if self.above and self.canvas.find_withtag(self.above):
+            self.canvas.tag_raise(self.image_id, self.above)
+        else:
+            self.canvas.tag_lower(self.image_id)